@@ -0,0 +1,192 @@
+"""Batch analysis of positions (one position in notation per line, see python/notation.py)
+
+    python analyze.py positions.txt -o results.ndjson --time 2 --workers 4
+    cat positions.txt | python analyze.py - --mode perft --depth 3
+
+Results are written as NDJSON lines as soon as a position is finished (in order of completion),
+each with the line number of its position. With --resume, positions already in the output file are skipped.
+"""
+
+from python import gameboard
+from python import move_manager as move_mgr
+from python import notation
+from python import rules
+from python import bot
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import argparse, json, os, signal, sys, time
+
+MODE_SEARCH = 'search'
+MODE_PERFT = 'perft'
+
+
+def main():
+    args = parse_args()
+
+    done_lines = read_done_lines(args.output) if args.resume else set()
+    output = open(args.output, 'a' if args.resume else 'w') if args.output != '-' else sys.stdout
+    positions_file = open(args.input) if args.input != '-' else sys.stdin
+
+    max_pending = args.workers * 4 # Bounded number of positions in memory
+    finished = 0
+    start_time = time.time()
+
+    executor = ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=init_worker,
+        initargs=(args.depth, args.time, args.no_cache)
+    )
+    pending = set()
+    try:
+        for line_no, text in read_positions(positions_file):
+            if line_no in done_lines:
+                continue
+
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                finished += write_results(output, done)
+
+            pending.add(executor.submit(analyze_position, line_no, text, args.mode, args.depth))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            finished += write_results(output, done)
+
+    except KeyboardInterrupt:
+        print(f'\nInterrupted - finished positions are in the output (continue with --resume)', file=sys.stderr)
+        executor.shutdown(wait=False, cancel_futures=True)
+        sys.exit(130)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    executor.shutdown()
+    print(f'Analyzed {finished} positions in {time.time() - start_time:.1f} seconds', file=sys.stderr)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Analyze positions with the bot search or perft.')
+    parser.add_argument('input', help='File with one position per line ("-": stdin)')
+    parser.add_argument('-o', '--output', default='-', help='NDJSON result file ("-": stdout)')
+    parser.add_argument('--mode', choices=(MODE_SEARCH, MODE_PERFT), default=MODE_SEARCH)
+    parser.add_argument('--depth', type=int, default=None,
+                        help='Search depth (default: per board size, see minimax_limits_by_board_size) '
+                             'or perft depth (default: 3)')
+    parser.add_argument('--time', type=float, default=None,
+                        help='Time budget per position in seconds (default: per board size, '
+                             'see minimax_limits_by_board_size)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of processes')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the position cache')
+    parser.add_argument('--resume', action='store_true', help='Skip positions already in the output file')
+
+    args = parser.parse_args()
+    if args.resume and args.output == '-':
+        parser.error('--resume needs an output file')
+    if args.mode == MODE_PERFT and args.depth is None:
+        args.depth = 3
+    return args
+
+
+def read_positions(positions_file):
+    """Generator: Yield (line number, position) of all lines except empty lines and comments (#)"""
+
+    for line_no, line in enumerate(positions_file, start=1):
+        text = line.strip()
+        if text and not text.startswith('#'):
+            yield line_no, text
+
+
+def read_done_lines(path: str) -> set[int]:
+    """Line numbers of the positions already in an output file (an incomplete last line is ignored)"""
+
+    done_lines = set()
+    if not os.path.exists(path):
+        return done_lines
+
+    with open(path) as f:
+        for line in f:
+            try:
+                done_lines.add(json.loads(line)['line'])
+            except (ValueError, KeyError):
+                pass # Written while interrupted
+    return done_lines
+
+
+def write_results(output, futures) -> int:
+    """Write results as NDJSON and flush, so they survive an interruption\n
+    Return: number of written results"""
+
+    for future in futures:
+        output.write(json.dumps(future.result()) + '\n')
+    output.flush()
+    return len(futures)
+
+
+# --------------------------------------------------------------------------
+# Worker processes
+# --------------------------------------------------------------------------
+
+def init_worker(max_depth: int, max_time_sec: float, no_cache: bool):
+    """Apply the search limits of the command line to the bot of this worker"""
+
+    sys.stdout = sys.stderr # Keep messages of the engine out of the NDJSON output
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C is handled by the main process
+
+    overridden = set()
+    if max_depth is not None:
+        bot.MAX_DEPTH = max_depth
+        overridden.add('max_depth')
+    if max_time_sec is not None:
+        bot.TIMEOUT_SEC = max_time_sec
+        overridden.add('timeout_sec')
+    bot.LIMITS_BY_BOARD_SIZE = [ # Limits of the command line hold for every board size
+        {key: value for key, value in row.items() if key not in overridden}
+        for row in bot.LIMITS_BY_BOARD_SIZE
+    ]
+    if no_cache:
+        bot.USE_POSITION_CACHE = False
+
+
+def analyze_position(line_no: int, text: str, mode: str, depth: int) -> dict:
+    """Analyze a single position\n
+    Return: result (or error) as dict"""
+
+    result = {'line': line_no, 'position': text}
+    try:
+        (board_size_x, board_size_y,
+         white_pieces, white_kings,
+         black_pieces, black_kings, moving_white) = notation.from_notation(text)
+        gameboard.use_board_size(board_size_x, board_size_y)
+        bitboard = (white_pieces, white_kings, black_pieces, black_kings)
+
+        if any(rules.check_for_winner(*bitboard)):
+            raise ValueError('The game is already finished')
+
+        start_time = time.time()
+        if mode == MODE_PERFT:
+            result['depth'] = depth
+            result['perft'] = move_mgr.perft(*bitboard, moving_white, depth)
+            result['elapsed_sec'] = time.time() - start_time
+            return result
+
+        cur_mask, dst_mask, stats = bot.find_move_for_bot(*bitboard, moving_white, return_stats=True)
+        result['move'] = {
+            'from': list(reversed(divmod(cur_mask.bit_length() - 1, board_size_x))),
+            'to': list(reversed(divmod(dst_mask.bit_length() - 1, board_size_x))),
+        }
+        result['score'] = stats.iterations[-1]['score'] if stats.iterations else None
+        result['depth'] = stats.depth()
+        result['nodes'] = stats.nodes
+        result['elapsed_sec'] = stats.elapsed_sec
+        result['timeout_reason'] = stats.timeout_reason
+        result['cache_hit'] = stats.cache_hit
+    except ValueError as e:
+        result['error'] = str(e)
+    except Exception as e: # Any failure stays with its position, the run goes on
+        result['error'] = f'{type(e).__name__}: {e}'
+
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,13 @@
-from dataclasses import dataclass
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
 from flask import Flask, jsonify
 from flask import render_template
-from flask import request, redirect, url_for
+from flask import request, redirect, url_for, session, g
+from flask import Response, stream_with_context
 from typing import List, Optional
 from python import *
+import atexit, json, logging, math, os, threading, time, uuid
+from collections import deque
 
 
 # --------------------------------------------------------------------------
@@ -21,8 +25,6 @@ class GameConfig:
     def is_user_light(self):
         return True if self.user_color == gl.COLOR_LIGHT else False
 
-config = GameConfig()
-
 
 # --------------------------------------------------------------------------
 # Definition of Piece Class
@@ -46,14 +48,6 @@ class Piece:
         
         self.is_king = True
 
-class LightPiece(Piece):
-    def __init__(self, color=gl.COLOR_LIGHT):
-        super().__init__(color)
-
-class DarkPiece(Piece):
-    def __init__(self, color=gl.COLOR_DARK):
-        super().__init__(color)
-
 
 # --------------------------------------------------------------------------
 # Flask logic
@@ -62,6 +56,60 @@ class DarkPiece(Piece):
 # Initialize Flask
 app = Flask(__name__)
 
+# Signs the session cookie (settings of the last game). 
+# All worker processes must share the same key, so set it for multi-process servers.
+app.secret_key = os.environ.get('LATRONES_SECRET_KEY') or os.urandom(32)
+
+# Stop running bot searches when the server shuts down
+atexit.register(cancellation.cancel_all, cancellation.REASON_SHUTDOWN)
+
+# Phases of every request as "Server-Timing" header (and optionally as JSON log line)
+LOG_SERVER_TIMING = gl.CONFIG["server_timing_log"]
+timing_logger = logging.getLogger('latrones.timing')
+
+# Batch analysis (/api/analyze)
+ANALYSIS_MAX_POSITIONS = gl.CONFIG["analysis_max_positions"] # Max. positions per request
+ANALYSIS_MAX_TIME_BUDGET_SEC = gl.CONFIG["analysis_max_time_budget_sec"] # Max. total time budget per request
+ANALYSIS_JOBS_PER_CLIENT = gl.CONFIG["analysis_max_jobs_per_client"] # Bot workers a client may use at the same time
+analysis_clients = set() # Clients with a running batch (one batch per client)
+analysis_clients_lock = threading.Lock()
+
+# Current load (read when /metrics is scraped)
+metrics.gauge('latrones_active_games', 'Games in the game store', game_store.count_games)
+metrics.gauge('latrones_bot_jobs_queued', 'Bot jobs waiting for a worker', lambda: bot_jobs.get_stats()['queued'])
+metrics.gauge('latrones_bot_jobs_running', 'Bot searches running', lambda: bot_jobs.get_stats()['running'])
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start_time = time.perf_counter()
+    g.timings = [] # [(phase, seconds), ...]
+
+
+@app.after_request
+def record_request_duration(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'unknown'
+    duration_sec = time.perf_counter() - g.request_start_time
+    metrics.REQUEST_DURATION.observe(
+        duration_sec,
+        method=request.method,
+        route=route,
+        status=response.status_code
+    )
+
+    timings = g.timings + [('total', duration_sec)]
+    response.headers['Server-Timing'] = ', '.join(
+        f'{phase};dur={seconds * 1000:.2f}' for phase, seconds in timings
+    )
+    if LOG_SERVER_TIMING:
+        timing_logger.info(json.dumps({
+            'method': request.method,
+            'route': route,
+            'status': response.status_code,
+            'timings_ms': {phase: round(seconds * 1000, 3) for phase, seconds in timings},
+        }))
+    return response
+
 
 @app.route('/')
 def index():
@@ -71,302 +119,494 @@ def index():
 
 @app.route('/play')
 def play():
-    '''Begin game'''
+    '''Begin game (with the settings of the last game of this session)'''
 
-    global config
+    with __timed('create'):
+        game = __create_game(__get_session_config())
 
-    gl.update_global_variables(config.board_size_x, config.board_size_y)
+    return __render_game(game)
 
-    (white_pieces, white_kings, 
-     black_pieces, black_kings) = gameboard.create_bitboard_new_game(
-        board_size_x=config.board_size_x, 
-        board_size_y=config.board_size_y, 
-        user_is_white=config.is_user_light()
-    )
 
-    board = __bitboard_to_board(
-        white_pieces, 
-        white_kings, 
-        black_pieces, 
-        black_kings,
-        config.board_size_x,
-        config.board_size_y
+@app.route('/restart', methods=['POST'])
+def restart():
+    '''Restart game with new settings'''
+
+    # Stop searches of the previous game and forget it
+    previous_game_id = request.form.get('game_id')
+    if previous_game_id:
+        cancellation.cancel_game(previous_game_id, cancellation.REASON_RESTART)
+        game_store.remove_game(previous_game_id)
+
+    with __timed('parse'):
+        try:
+            config = __parse_game_config(request.form)
+        except ValueError as e:
+            return str(e), 400
+        session['game_config'] = asdict(config)
+
+    with __timed('create'):
+        game = __create_game(config)
+
+    return __render_game(game)
+
+
+@app.route('/api/games/<game_id>')
+def api_game(game_id):
+    '''Get the current position of a game (bitboards as hex strings) and its legal moves'''
+
+    game = game_store.get_game(game_id)
+    if game is None:
+        return jsonify({'error': 'Unknown game'}), 404
+
+    with game.lock:
+        position = __position_to_dict(game)
+        position['legal_moves'] = __legal_moves_to_dict(game)
+        return jsonify(position)
+
+
+@app.route('/api/games/<game_id>/move', methods=['POST'])
+def api_move(game_id):
+    '''Move piece by user\n
+    Request: {"from": [x, y], "to": [x, y]}\n
+    Return: only the changes (moved piece, captured squares, winner, new turn) 
+    and all legal moves of the new turn'''
+
+    game = game_store.get_game(game_id)
+    if game is None:
+        return jsonify({'error': 'Unknown game'}), 404
+
+    with __timed('parse'):
+        try:
+            cur_mask, dst_mask = __parse_move_request(game, request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    with game.lock:
+        try:
+            changes = __play_user_move(game, cur_mask, dst_mask)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 409
+
+    return jsonify(changes)
+
+
+@app.route('/api/games/<game_id>/move_and_reply', methods=['POST'])
+def api_move_and_reply(game_id):
+    '''Move piece by user and let the bot reply in the same request\n
+    Request: {"from": [x, y], "to": [x, y]}\n
+    Return: NDJSON stream - first the changes of the user move ({"type": "move", ...}), 
+    then the bot job after every completed search depth and when done ({"type": "bot", "job": {...}})'''
+
+    game = game_store.get_game(game_id)
+    if game is None:
+        return jsonify({'error': 'Unknown game'}), 404
+
+    try:
+        profile_mode = __get_requested_profile_mode()
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    with __timed('parse'):
+        try:
+            cur_mask, dst_mask = __parse_move_request(game, request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    job = None
+    job_error = None
+    with game.lock:
+        try:
+            changes = __play_user_move(game, cur_mask, dst_mask)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 409
+
+        if not game.is_finished() and game.is_bot_turn():
+            try:
+                with __timed('submit'):
+                    job = __submit_bot_job(game, profile_mode)
+            except bot_jobs.JobQueueFull as e:
+                job_error = str(e)
+
+    def generate():
+        yield json.dumps({'type': 'move', **changes}) + '\n' # Intermediate board first
+
+        if job_error is not None:
+            yield json.dumps({'type': 'error', 'error': job_error}) + '\n'
+        if job is None:
+            return
+
+        for job_dict in __follow_bot_job(job):
+            if job_dict is None:
+                yield '\n' # Keepalive (detects closed connections)
+            else:
+                yield json.dumps({'type': 'bot', 'job': job_dict}) + '\n'
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache'}
     )
-    current_turn = gl.COLOR_LIGHT
 
-    return render_template(
-        'play.html', 
-        board=__switch_board_view(board), 
-        current_turn=current_turn,
-        play_against_bot=config.play_against_bot,
-        game_time_seconds=config.game_time_seconds,
-        user_color=config.user_color
+
+@app.route('/api/analyze', methods=['POST'])
+def api_analyze():
+    '''Analyze a batch of positions with the bot on the worker pool\n
+    Request: {"positions": ["8x8 bbbbbbbb/3B4/8/8/8/8/4W3/wwwwwwww w", ...], "time_budget_sec": 30}\n
+    Return: NDJSON stream - one line per position as soon as it is finished: 
+    {"index", "position", "move", "score", "depth", "nodes", "elapsed_sec", "cache_hit"} or {"index", "position", "error"}.\n
+    A client (header "X-Client-Id", else its address) can run one batch at a time, 
+    which uses at most `analysis_max_jobs_per_client` workers. Slow readers slow down the batch.'''
+
+    data = request.get_json(silent=True) or {}
+    positions = data.get('positions')
+    if not isinstance(positions, list) or not positions:
+        return jsonify({'error': 'Expected {"positions": [...], "time_budget_sec": ...}'}), 400
+    if len(positions) > ANALYSIS_MAX_POSITIONS:
+        return jsonify({'error': f'At most {ANALYSIS_MAX_POSITIONS} positions per request'}), 413
+
+    try:
+        time_budget_sec = float(data.get('time_budget_sec', ANALYSIS_MAX_TIME_BUDGET_SEC))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'time_budget_sec must be a number'}), 400
+    time_budget_sec = min(max(time_budget_sec, 0.0), ANALYSIS_MAX_TIME_BUDGET_SEC)
+
+    client = request.headers.get('X-Client-Id') or request.remote_addr
+    with analysis_clients_lock:
+        if client in analysis_clients:
+            return jsonify({'error': 'A batch of this client is still running'}), 429
+        analysis_clients.add(client)
+
+    def release_client():
+        with analysis_clients_lock:
+            analysis_clients.discard(client)
+
+    response = Response(
+        stream_with_context(__analyze_positions(positions, time_budget_sec)),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache'}
     )
+    response.call_on_close(release_client)
+    return response
 
 
-@app.route('/restart', methods=['POST'])
-def restart():
-    '''Restart game with new settings'''
+@app.route('/move_bot', methods=['POST'])
+def move_bot():
+    '''Start the search of a bot move in the background\n
+    Return: job id (follow the job at /move_bot/<job_id> or /move_bot/<job_id>/events)'''
 
-    global config
+    if request.method == 'POST':
 
-    config.game_time_seconds = int(request.form.get('game_time_seconds'))
-    config.board_size_x = int(request.form.get('board_size'))
-    config.user_color = request.form.get('user_color')
-    config.play_against_bot = True if request.form.get('play_against_bot').lower() == 'true' else False
+        game = game_store.get_game(request.form['game_id'])
+        if game is None:
+            return jsonify({'error': 'Unknown game'}), 404
 
-    gl.update_global_variables(config.board_size_x, config.board_size_y)
+        try:
+            profile_mode = __get_requested_profile_mode()
+        except PermissionError as e:
+            return jsonify({'error': str(e)}), 403
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-    (white_pieces, white_kings, 
-     black_pieces, black_kings) = gameboard.create_bitboard_new_game(
-        board_size_x=config.board_size_x, 
-        board_size_y=config.board_size_y, 
-        user_is_white=config.is_user_light()
-    )
+        with game.lock:
+            if game.is_finished():
+                return jsonify({'error': 'The game is already finished'}), 409
+            if not game.is_bot_turn():
+                return jsonify({'error': 'It is not the turn of the bot'}), 409
 
-    board = __bitboard_to_board(
-        white_pieces, 
-        white_kings, 
-        black_pieces, 
-        black_kings,
-        config.board_size_x,
-        config.board_size_y
-    )
-    current_turn = gl.COLOR_LIGHT
+            try:
+                with __timed('submit'):
+                    job = __submit_bot_job(game, profile_mode)
+            except bot_jobs.JobQueueFull as e:
+                return jsonify({'error': str(e)}), 503
 
-    return render_template(
-        'play.html', 
-        board=__switch_board_view(board), 
-        current_turn=current_turn,
-        play_against_bot=config.play_against_bot,
-        game_time_seconds=config.game_time_seconds,
-        user_color=config.user_color
-    )
+        return jsonify({'job_id': job.job_id}), 202
 
 
-@app.route('/possible_moves', methods=['POST'])
-def possible_moves():
-    '''Click on a piece'''
+@app.route('/move_bot/stats')
+def move_bot_stats():
+    '''Load of the bot scheduler: queue depth, running searches and queue wait times'''
 
-    if request.method == 'POST':
+    return jsonify(bot_jobs.get_stats())
 
-        current_turn = request.form['current_turn']
-        board_size_x = int(request.form['board_size_x'])
-        board_size_y = int(request.form['board_size_y'])
 
-        # gl.update_global_variables(board_size_x, board_size_y)
+@app.route('/move_bot/<job_id>')
+def move_bot_status(job_id):
+    '''Poll the state of a bot move search'''
 
-        board = __prepare_board(request)
-        (white_pieces, white_kings, 
-         black_pieces, black_kings) = __board_to_bitboard(board)
-        
-        if current_turn == gl.COLOR_LIGHT:
-            moving_white = True
-        else:
-            moving_white = False
-        
-        current_position = {
-            'x': int(request.form['cur_x']),
-            'y': int(request.form['cur_y'])
-        }
-        cur_idx = gameboard.get_bit_index(
-            current_position['x'], 
-            current_position['y']
-        )
-        cur_mask = 1 << cur_idx
+    job = bot_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
 
-        moves_list = move_mgr.find_legal_moves_for_position(
-            white_pieces, 
-            white_kings, 
-            black_pieces, 
-            black_kings,
-            cur_mask,
-            moving_white
-        )
+    # Where the time of the bot move went (measured by scheduler and worker, not part of this request)
+    if job.dispatched_time is not None:
+        g.timings.append(('bot_queue', job.wait_sec()))
+    if job.result is not None:
+        g.timings.append(('bot_search', job.result['stats']['elapsed_sec']))
 
-        dst_list = [move[1] for move in moves_list]
-        possible_moves_2Dlist = __convert_pos_list_to_2Dposlist(
-            dst_list,
-            board_size_x
-        )
+    with __timed('encode'):
+        job_dict = __bot_job_to_dict(job)
+    return jsonify(job_dict)
 
-        return jsonify(possible_moves_2Dlist)
 
+@app.route('/move_bot/<job_id>/events')
+def move_bot_events(job_id):
+    '''Stream the state of a bot move search as Server-Sent Events 
+    (one event per completed search depth and one when finished)'''
 
-@app.route('/move', methods=['POST'])
-def move_piece():
-    '''Move piece by user'''
+    job = bot_jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
 
-    if request.method == 'POST':
+    def generate():
+        for job_dict in __follow_bot_job(job):
+            if job_dict is None:
+                yield ': keepalive\n\n' # Detects closed connections
+            else:
+                yield f'data: {json.dumps(job_dict)}\n\n'
 
-        current_turn = request.form['current_turn']
-        board_size_x = int(request.form['board_size_x'])
-        board_size_y = int(request.form['board_size_y'])
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache'}
+    )
 
-        board = __prepare_board(request)
-        (white_pieces, white_kings, 
-         black_pieces, black_kings) = __board_to_bitboard(board)
-        
-        if current_turn == gl.COLOR_LIGHT:
-            moving_white = True
-        else:
-            moving_white = False
-
-        current_position = {
-            'x': int(request.form['cur_x']),
-            'y': int(request.form['cur_y'])
-        }
-        destination = {
-            'x': int(request.form['dst_x']),
-            'y': int(request.form['dst_y'])
-        }
-
-        cur_idx = gameboard.get_bit_index(
-            current_position['x'], 
-            current_position['y']
-        )
-        dst_idx = gameboard.get_bit_index(
-            destination['x'], 
-            destination['y']
-        )
-        
-        cur_mask = 1 << cur_idx
-        dst_mask = 1 << dst_idx
-        
-        ((white_pieces_new, white_kings_new, 
-          black_pieces_new, black_kings_new),
-         (white_wins, black_wins)
-          )= move_mgr.move(
-            white_pieces, 
-            white_kings, 
-            black_pieces, 
-            black_kings,
-            cur_mask,
-            dst_mask,
-            moving_white
-        )
 
-        board_new = __bitboard_to_board(
-            white_pieces_new, 
-            white_kings_new, 
-            black_pieces_new, 
-            black_kings_new,
-            board_size_x,
-            board_size_y
-        )
-        
-        winner = __get_winner_as_string(white_wins, black_wins)
-        current_turn = __get_opposite_color(current_turn) # Update value of current turn color after new move
-        
-        return render_template('_board_table.html',
-            board=board_new,
-            current_turn=current_turn,
-            winner=winner,
-            move_result=True, 
-            move_error=None
-        )
+@app.route('/metrics')
+def metrics_endpoint():
+    '''Metrics of requests, bot searches and load in the Prometheus text format (per process)'''
 
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
-@app.route('/move_bot', methods=['POST'])
-def move_bot():
-    '''Move piece by bot'''
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    '''Show or set the fraction of bot searches to profile (needs the admin token in "X-Admin-Token")\n
+    Request (POST): {"sample_rate": 0.01, "mode": "sampling" | "cprofile"}\n
+    Dumps are written to the configured profiling directory'''
+
+    if not profiling.is_authorized(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'Profiling needs a valid admin token'}), 403
 
     if request.method == 'POST':
+        data = request.get_json()
+        try:
+            profiling.set_sampling(data['sample_rate'], data.get('mode', profiling.MODE_SAMPLING))
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
 
-        current_turn = request.form['current_turn']
-        board_size_x = int(request.form['board_size_x'])
-        board_size_y = int(request.form['board_size_y'])
+    return jsonify({**profiling.get_sampling(), 'dir': profiling.PROFILE_DIR})
 
-        board = __prepare_board(request)
-        (white_pieces, white_kings, 
-         black_pieces, black_kings) = __board_to_bitboard(board)
-        
-        if current_turn == gl.COLOR_LIGHT:
-            moving_white = True
-        else:
-            moving_white = False
-
-        cur_mask, dst_mask = bot.find_move_for_bot(
-            white_pieces, 
-            white_kings, 
-            black_pieces, 
-            black_kings,
-            moving_white
-        )
 
-        ((white_pieces_new, white_kings_new, 
-          black_pieces_new, black_kings_new),
-         (white_wins, black_wins)
-          )= move_mgr.move(
-            white_pieces, 
-            white_kings, 
-            black_pieces, 
-            black_kings,
-            cur_mask,
-            dst_mask,
-            moving_white
-        )
-        
-        board_new = __bitboard_to_board(
-            white_pieces_new, 
-            white_kings_new, 
-            black_pieces_new, 
-            black_kings_new,
-            board_size_x,
-            board_size_y
-        )
-        
-        winner = __get_winner_as_string(white_wins, black_wins)
-        current_turn = __get_opposite_color(current_turn)
-
-        return render_template('_board_table.html',
-            board=board_new,
-            current_turn=current_turn,
-            winner=winner,
-            move_result=True, 
-            move_error=None
-        )
+@app.route('/cancel_bot', methods=['POST'])
+def cancel_bot():
+    '''Cancel running bot searches of a game (tab closed or client timeout)'''
+
+    game_id = request.form.get('game_id')
+    if game_id:
+        cancellation.cancel_game(game_id, cancellation.REASON_DISCONNECT)
+
+    return ('', 204)
 
 
 # --------------------------------------------------------------------------
-# Generation of board from existing state
+# Moves of user and bot
 # --------------------------------------------------------------------------
 
-def __prepare_board(request) -> list:
-    '''Generate board with pieces'''
+def __parse_move_request(game: game_store.GameState, data) -> tuple[int, int]:
+    """Squares of the move {"from": [x, y], "to": [x, y]} of a request body\n
+    Raises ValueError if the body has another shape or a square is not on the board.\n
+    Return: cur_mask, dst_mask"""
 
-    board_size_x = int(request.form['board_size_x'])
-    board_size_y = int(request.form['board_size_y'])
-    pieces_count = int(request.form['pieces_count'])
-    prepared_board = __generate_empty_board(board_size_x, board_size_y)
+    if not isinstance(data, dict):
+        raise ValueError('Expected {"from": [x, y], "to": [x, y]}')
 
-    for i in range(pieces_count):
-        x = int(request.form['pieces['+str(i)+'][x]'])
-        y = int(request.form['pieces['+str(i)+'][y]'])
-        color = request.form['pieces['+str(i)+'][color]']
-        king = request.form['pieces['+str(i)+'][king]'] == 'true'
+    masks = []
+    for key in ('from', 'to'):
+        square = data.get(key)
+        if not (isinstance(square, list) and len(square) == 2 and
+                all(isinstance(value, int) and not isinstance(value, bool) for value in square)):
+            raise ValueError(f'Expected "{key}": [x, y] with integer coordinates')
+        masks.append(__get_position_mask(game, *square))
+    return tuple(masks)
 
-        if color == 'DarkPiece':
-            prepared_piece = DarkPiece()
-        if color == 'LightPiece':
-            prepared_piece = LightPiece()
-        if king:
-            prepared_piece.become_king()
 
-        prepared_board[y][x] = prepared_piece
+def __play_user_move(game: game_store.GameState, cur_mask: int, dst_mask: int) -> dict:
+    """Play a move of the user on the game (game lock must be held)\n
+    Raises ValueError if the move is not legal.\n
+    Return: changes of the move and legal moves of the new turn"""
 
-    return prepared_board
+    if game.is_bot_turn():
+        raise ValueError('Move Error: It is the turn of the bot.')
 
+    bitboard = game.bitboard()
+    with __timed('move'):
+        captured_mask = game.play_move(cur_mask, dst_mask) # Incl. legality check
 
-def __generate_empty_board(size_x: int, size_y: int) -> list:
-    '''Generate empty board'''
+    with __timed('encode'):
+        changes = __move_to_dict(
+            game.board_size_x,
+            bitboard,
+            cur_mask,
+            dst_mask,
+            captured_mask,
+            game.white_wins,
+            game.black_wins
+        )
+    with __timed('legal_moves'):
+        changes['legal_moves'] = __legal_moves_to_dict(game)
+    return changes
+
+
+def __submit_bot_job(game: game_store.GameState, profile_mode: str = None) -> bot_jobs.BotJob:
+    """Start the bot search for the side to move (game lock must be held).
+    The found move is played on the game, unless the game went on in the meantime."""
+
+    ply = len(game.history)
+
+    def apply_bot_move(job):
+        with game.lock:
+            if len(game.history) == ply:
+                game.play_move(job.result['cur_mask'], job.result['dst_mask'])
+
+    return bot_jobs.submit(
+        game.game_id,
+        game.board_size_x,
+        game.board_size_y,
+        *game.bitboard(),
+        game.moving_white,
+        remaining_time_sec=game.remaining_time_sec(game.moving_white),
+        on_done=apply_bot_move,
+        profile_mode=profile_mode
+    )
 
-    board = []
 
-    for i in range(size_y):
-        board.append([None]*size_x) # Empty row
+def __get_requested_profile_mode() -> str:
+    """Get the profiler requested by the header "X-Profile-Search: sampling|cprofile" 
+    (needs the admin token in "X-Admin-Token")\n
+    Raises PermissionError if the token is wrong, ValueError for unknown modes.\n
+    Return: profiling mode or None"""
+
+    profile_mode = request.headers.get('X-Profile-Search')
+    if not profile_mode:
+        return None
+
+    if not profiling.is_authorized(request.headers.get('X-Admin-Token')):
+        raise PermissionError('Profiling needs a valid admin token')
+    if profile_mode not in profiling.MODES:
+        raise ValueError(f'Unknown profiling mode {profile_mode!r}')
+    return profile_mode
+
+
+def __follow_bot_job(job: bot_jobs.BotJob, keepalive_sec: float = 2.0):
+    """Generator: Yield the client view of a job whenever it changes until it is finished, 
+    None as keepalive if nothing happened for `keepalive_sec`.\n
+    If the consumer stops early (client went away), the search is cancelled."""
+
+    sent_version = -1
+    try:
+        while True:
+            if job.version > sent_version:
+                sent_version = job.version
+                yield __bot_job_to_dict(job)
+                if job.is_finished():
+                    return
+            elif not bot_jobs.wait_for_update(job, sent_version, timeout_sec=keepalive_sec):
+                yield None
+    except GeneratorExit:
+        # Client went away - nobody needs the move anymore
+        if not job.is_finished():
+            job.cancel_token.cancel(cancellation.REASON_DISCONNECT)
+        raise
+
+
+def __analyze_positions(positions: list, time_budget_sec: float, keepalive_sec: float = 2.0):
+    """Generator: Search the bot move of all positions on the worker pool, 
+    at most `ANALYSIS_JOBS_PER_CLIENT` at the same time, and yield an NDJSON line per finished position.\n
+    The time budget is shared by the remaining positions. New jobs are only submitted 
+    while the consumer reads (backpressure) and while the job queue has room."""
+
+    batch_id = f'analysis-{uuid.uuid4().hex}' # Cancels all jobs of the batch
+    deadline = time.time() + time_budget_sec
+    waiting = deque(enumerate(positions))
+    running = {} # job_id --> (job, index, position)
+
+    try:
+        while waiting or running:
+            # Fill free worker slots of this client
+            while waiting and len(running) < ANALYSIS_JOBS_PER_CLIENT:
+                index, text = waiting[0]
+                remaining_sec = deadline - time.time()
+                try:
+                    if remaining_sec <= 0:
+                        raise ValueError('Time budget exhausted')
+                    (board_size_x, board_size_y,
+                     white_pieces, white_kings,
+                     black_pieces, black_kings, moving_white) = notation.from_notation(str(text))
+                    if any(rules.check_for_winner(white_pieces, white_kings, black_pieces, black_kings)):
+                        raise ValueError('The game is already finished')
+
+                    # Split the remaining budget on the remaining rounds of parallel jobs
+                    rounds = math.ceil(len(waiting) / ANALYSIS_JOBS_PER_CLIENT)
+                    job = bot_jobs.submit(
+                        batch_id,
+                        board_size_x,
+                        board_size_y,
+                        white_pieces, white_kings,
+                        black_pieces, black_kings,
+                        moving_white,
+                        max_time_sec=remaining_sec / rounds
+                    )
+                except ValueError as e:
+                    waiting.popleft()
+                    yield json.dumps({'index': index, 'position': text, 'error': str(e)}) + '\n'
+                    continue
+                except bot_jobs.JobQueueFull:
+                    break # Try again when a job finished
+
+                waiting.popleft()
+                running[job.job_id] = (job, index, text)
+
+            if not running:
+                time.sleep(0.1) # Job queue full with jobs of others
+                yield '\n' # Keepalive
+                continue
+
+            if not bot_jobs.wait_for_any([job for job, _, _ in running.values()], keepalive_sec):
+                yield '\n' # Keepalive (detects closed connections)
+                continue
+
+            for job_id, (job, index, text) in list(running.items()):
+                if job.is_finished():
+                    del running[job_id]
+                    yield json.dumps({'index': index, 'position': text, **__analysis_result(job)}) + '\n'
+
+    except GeneratorExit:
+        # Client went away - stop the rest of the batch
+        cancellation.cancel_game(batch_id, cancellation.REASON_DISCONNECT)
+        raise
 
-    return board
+
+def __analysis_result(job: bot_jobs.BotJob) -> dict:
+    """Get the result of a finished analysis job"""
+
+    if job.status != bot_jobs.STATUS_DONE:
+        return {'error': job.error or f'Search {job.status}'}
+
+    stats = job.result['stats']
+    cur_pos, dst_pos = __convert_pos_list_to_2Dposlist(
+        [job.result['cur_mask'], job.result['dst_mask']],
+        job.board_size_x
+    )
+    return {
+        'move': {'from': cur_pos, 'to': dst_pos},
+        'score': stats['iterations'][-1]['score'] if stats['iterations'] else None,
+        'depth': stats['depth'],
+        'nodes': stats['nodes'],
+        'elapsed_sec': stats['elapsed_sec'],
+        'cache_hit': stats['cache_hit'],
+    }
 
 
 # --------------------------------------------------------------------------
@@ -408,51 +648,114 @@ def __bitboard_to_board(white_pieces: int,
     return board
 
 
-def __board_to_bitboard(board: List[List[Optional[Piece]]]) -> tuple[int, int, int, int]:
-    """
-    Convert a 2D board of Piece instances into bitboard representation.
-    
-    Returns:
-        - white_pieces: int
-        - white_kings: int
-        - black_pieces: int
-        - black_kings: int
-    """
-    white_pieces = 0
-    white_kings = 0
-    black_pieces = 0
-    black_kings = 0
+# --------------------------------------------------------------------------
+# Helper functions
+# --------------------------------------------------------------------------
 
-    board_size_y = len(board)
-    board_size_x = len(board[0]) if board else 0
+@contextmanager
+def __timed(phase: str):
+    """Context: Measure a phase of the request for the "Server-Timing" header"""
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.timings.append((phase, time.perf_counter() - start_time))
+
+
+def __parse_game_config(form) -> GameConfig:
+    """Settings of a new game from the settings form\n
+    Raises ValueError for missing, non-numeric or unsupported values.\n
+    Return: GameConfig"""
+
+    try:
+        board_size = int(form['board_size'])
+        game_time_seconds = int(form['game_time_seconds'])
+        user_color = form['user_color']
+        play_against_bot = form['play_against_bot'].lower() == 'true'
+    except (KeyError, ValueError):
+        raise ValueError('Expected board_size, user_color, play_against_bot and game_time_seconds') from None
+
+    if not gl.MIN_BOARD_SIZE <= board_size <= gl.MAX_BOARD_SIZE:
+        raise ValueError(f'board_size must be between {gl.MIN_BOARD_SIZE} and {gl.MAX_BOARD_SIZE}')
+    if user_color not in (gl.COLOR_LIGHT, gl.COLOR_DARK):
+        raise ValueError(f'user_color must be {gl.COLOR_LIGHT} or {gl.COLOR_DARK}')
+    if game_time_seconds <= 0:
+        raise ValueError('game_time_seconds must be positive')
+
+    return GameConfig(
+        board_size_x=board_size,
+        board_size_y=board_size,
+        user_color=user_color,
+        play_against_bot=play_against_bot,
+        game_time_seconds=game_time_seconds
+    )
 
-    gl.update_global_variables(board_size_x, board_size_y)
 
-    for y in range(board_size_y):
-        for x in range(board_size_x):
-            piece = board[y][x]
-            if piece is None:
-                continue
+def __get_session_config() -> GameConfig:
+    """Get the settings of the last game of this session (defaults for a new session)"""
 
-            index = y * board_size_x + x
+    return GameConfig(**session.get('game_config', {}))
 
-            if piece.color == gl.COLOR_LIGHT:
-                if piece.is_king:
-                    white_kings |= (1 << index)
-                else:
-                    white_pieces |= (1 << index)
-            elif piece.color == gl.COLOR_DARK:
-                if piece.is_king:
-                    black_kings |= (1 << index)
-                else:
-                    black_pieces |= (1 << index)
 
-    return white_pieces, white_kings, black_pieces, black_kings
+def __create_game(config: GameConfig) -> game_store.GameState:
+    """Create a new game with the given settings"""
 
+    return game_store.create_game(
+        board_size_x=config.board_size_x, 
+        board_size_y=config.board_size_y, 
+        user_is_white=config.is_user_light(),
+        game_time_seconds=config.game_time_seconds,
+        play_against_bot=config.play_against_bot
+    )
+
+
+def __render_game(game: game_store.GameState):
+    """Render the page of a game"""
+
+    with __timed('convert'):
+        board = __game_to_board(game)
+    with __timed('legal_moves'):
+        legal_moves = __legal_moves_to_dict(game)
+
+    with __timed('render'):
+        return render_template(
+            'play.html', 
+            board=board, 
+            current_turn=__get_turn_color(game),
+            legal_moves=legal_moves,
+            play_against_bot=game.play_against_bot,
+            game_time_seconds=int(game.game_time_seconds),
+            user_color=gl.COLOR_LIGHT if game.user_is_white else gl.COLOR_DARK,
+            game_id=game.game_id
+        )
+
+
+def __game_to_board(game: game_store.GameState) -> List[List[Optional[Piece]]]:
+    """Get the 2D board of a game's current position"""
+
+    return __bitboard_to_board(
+        *game.bitboard(),
+        game.board_size_x,
+        game.board_size_y
+    )
+
+
+def __get_position_mask(game: game_store.GameState, x: int, y: int) -> int:
+    """Get the bitboard mask of a square given by its coordinates"""
+
+    x, y = int(x), int(y)
+    if not (0 <= x < game.board_size_x and 0 <= y < game.board_size_y):
+        raise ValueError(f'Position ({x}, {y}) is not on the board.')
+
+    return 1 << (y * game.board_size_x + x)
+
+
+def __get_turn_color(game: game_store.GameState) -> str:
+    """Get color of the side to move (COLOR_LIGHT or COLOR_DARK)"""
+
+    return gl.COLOR_LIGHT if game.moving_white else gl.COLOR_DARK
 
-# --------------------------------------------------------------------------
-# Helper functions
-# --------------------------------------------------------------------------
 
 def __print_board(board):
     """
@@ -478,15 +781,6 @@ def __print_board(board):
         print(" ".join(row_str))
 
 
-def __switch_board_view(board):
-    """
-    Flip the board vertically.
-    Returns a new board with the transformed view.
-    """
-
-    return board[::-1]
-
-
 def __convert_pos_list_to_2Dposlist(
         pos_mask_list: list,
         board_size_x: int
@@ -505,14 +799,120 @@ def __convert_pos_list_to_2Dposlist(
     return pos_list
 
 
-def __get_opposite_color(my_color: str) -> str:
-    """Get opposite color (COLOR_LIGHT or COLOR_DARK) from input color"""
+def __bot_job_to_dict(job: bot_jobs.BotJob) -> dict:
+    '''Get the client view of a bot job (incl. the changes of the move and the next legal moves once it is done)'''
+
+    job_dict = {
+        'job_id': job.job_id,
+        'status': job.status,
+        'wait_sec': job.wait_sec(),
+        'degraded': job.is_degraded(),
+        'iterations': [
+            {
+                'depth': iteration['depth'],
+                'score': iteration['score'],
+                'move': __convert_pos_list_to_2Dposlist(
+                    [iteration['cur_mask'], iteration['dst_mask']],
+                    job.board_size_x
+                ),
+            }
+            for iteration in job.iterations
+        ],
+    }
+
+    if job.status == bot_jobs.STATUS_DONE:
+        all_pieces_before = job.bitboard[0] | job.bitboard[1] | job.bitboard[2] | job.bitboard[3]
+        all_pieces_after = (job.result['bitboard'][0] | job.result['bitboard'][1] | 
+                            job.result['bitboard'][2] | job.result['bitboard'][3])
+        captured_mask = all_pieces_before & ~all_pieces_after & ~job.result['cur_mask']
+
+        job_dict.update(__move_to_dict(
+            job.board_size_x,
+            job.bitboard,
+            job.result['cur_mask'],
+            job.result['dst_mask'],
+            captured_mask,
+            job.result['white_wins'],
+            job.result['black_wins']
+        ))
+
+        # The bot move was played on the game (see move_bot), so its legal moves belong to the next turn
+        game = game_store.get_game(job.game_id)
+        if game is not None:
+            with game.lock:
+                job_dict['legal_moves'] = __legal_moves_to_dict(game)
+        if job.result['profile_path'] is not None:
+            job_dict['profile'] = os.path.basename(job.result['profile_path'])
+    elif job.status == bot_jobs.STATUS_FAILED:
+        job_dict['error'] = job.error
+
+    return job_dict
+
+
+def __position_to_dict(game: game_store.GameState) -> dict:
+    '''Encode the position of a game compactly: four bitboards as hex strings, size and turn'''
+
+    return {
+        'board_size_x': game.board_size_x,
+        'board_size_y': game.board_size_y,
+        'white_pieces': format(game.white_pieces, 'x'),
+        'white_kings': format(game.white_kings, 'x'),
+        'black_pieces': format(game.black_pieces, 'x'),
+        'black_kings': format(game.black_kings, 'x'),
+        'turn': __get_turn_color(game),
+        'winner': __get_winner_as_string(game.white_wins, game.black_wins),
+        'ply': len(game.history),
+        'notation': notation.to_notation(
+            game.board_size_x, game.board_size_y, *game.bitboard(), game.moving_white
+        ),
+    }
+
+
+def __legal_moves_to_dict(game: game_store.GameState) -> dict:
+    '''Get all legal moves of the side to move as map "x,y" (from) --> [[x, y], ...] (destinations)'''
+
+    legal_moves = {}
+    for cur_mask, dst_list in game.legal_moves().items():
+        cur_x, cur_y = __convert_pos_list_to_2Dposlist([cur_mask], game.board_size_x)[0]
+        legal_moves[f'{cur_x},{cur_y}'] = __convert_pos_list_to_2Dposlist(dst_list, game.board_size_x)
+
+    return legal_moves
+
+
+def __move_to_dict(
+        board_size_x: int,
+        bitboard_before: tuple[int, int, int, int],
+        cur_mask: int,
+        dst_mask: int,
+        captured_mask: int,
+        white_wins: bool,
+        black_wins: bool
+    ) -> dict:
+    '''Encode the changes of a move: moved piece, captured squares, winner and new turn'''
+
+    white_pieces, white_kings, black_pieces, black_kings = bitboard_before
+    moving_white = bool((white_pieces | white_kings) & cur_mask)
+
+    cur_pos, dst_pos = __convert_pos_list_to_2Dposlist([cur_mask, dst_mask], board_size_x)
+
+    captured_list = []
+    while captured_mask:
+        pos_mask = captured_mask & -captured_mask # Isolate lowest set bit
+        captured_list.append(pos_mask)
+        captured_mask ^= pos_mask
+
+    return {
+        'move': {
+            'from': cur_pos,
+            'to': dst_pos,
+            'color': gl.COLOR_LIGHT if moving_white else gl.COLOR_DARK,
+            'king': bool((white_kings | black_kings) & cur_mask),
+        },
+        'captured': __convert_pos_list_to_2Dposlist(captured_list, board_size_x),
+        'winner': __get_winner_as_string(white_wins, black_wins),
+        'turn': gl.COLOR_DARK if moving_white else gl.COLOR_LIGHT,
+    }
 
-    if my_color == gl.COLOR_LIGHT:
-        return gl.COLOR_DARK
-    elif my_color == gl.COLOR_DARK:
-        return gl.COLOR_LIGHT
-    
 
 def __get_winner_as_string(white_wins: bool, black_wins: bool):
     '''Get winner as string COLOR_LIGHT, COLOR_DARK or None'''
@@ -522,6 +922,6 @@ def __get_winner_as_string(white_wins: bool, black_wins: bool):
     elif white_wins:
         return gl.COLOR_LIGHT
     elif black_wins:
-        return gl.COLOR_LIGHT
+        return gl.COLOR_DARK
     else:
         return None
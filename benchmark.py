@@ -0,0 +1,212 @@
+"""Micro benchmarks of the engine
+
+    python benchmark.py eval --board 8x8
+    python benchmark.py perft --board 8x8 --board 12x12 --depth 3
+    python benchmark.py boards --board 8x8 --board 16x16 --board 24x24
+"""
+
+from python import global_variables as gl
+from python import gameboard
+from python import batch_eval
+from python import bot
+from python import codegen
+from python import move_manager as move_mgr
+from python import notation
+from python import rules
+from python import simulator
+
+import argparse, sys, time
+
+BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+BOARD_SIZES = ('8x8', '12x12', '16x16', '20x20', '24x24')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro benchmarks of the engine.')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    parser_eval = subparsers.add_parser('eval', help='Scalar vs. NumPy batch evaluation (crossover batch size)')
+    parser_eval.add_argument('--board', default=f'{gl.CONFIG["default_board_size_x"]}x{gl.CONFIG["default_board_size_y"]}',
+                             help='Board size XxY')
+    parser_eval.add_argument('--positions', type=int, default=8192, help='Positions per measurement')
+
+    parser_perft = subparsers.add_parser('perft', help='Generic vs. generated rules (same counts, nodes per second)')
+    parser_perft.add_argument('--board', action='append', help='Board size XxY (repeatable, default: 8x8 and 12x12)')
+    parser_perft.add_argument('--depth', type=int, default=3)
+    parser_perft.add_argument('--positions', type=int, default=4, help='Positions per board size (incl. the initial one)')
+
+    parser_boards = subparsers.add_parser('boards', help='Bot nodes per second and latency against board size')
+    parser_boards.add_argument('--board', action='append', help=f'Board size XxY (repeatable, default: {", ".join(BOARD_SIZES)})')
+    parser_boards.add_argument('--positions', type=int, default=5, help='Positions per board size (incl. the initial one)')
+    parser_boards.add_argument('--generic', action='store_true', help='Use the generic instead of the generated rules')
+
+    args = parser.parse_args()
+    if args.benchmark == 'eval':
+        board_size_x, board_size_y = (int(value) for value in args.board.split('x'))
+        benchmark_eval(board_size_x, board_size_y, args.positions)
+    elif args.benchmark == 'perft':
+        boards = [tuple(int(value) for value in board.split('x')) for board in args.board or ('8x8', '12x12')]
+        if not benchmark_perft(boards, args.depth, args.positions):
+            sys.exit(1)
+    elif args.benchmark == 'boards':
+        boards = [tuple(int(value) for value in board.split('x')) for board in args.board or BOARD_SIZES]
+        benchmark_boards(boards, args.positions, args.generic)
+
+
+def benchmark_eval(board_size_x: int, board_size_y: int, number_of_positions: int):
+    """Time per position of the scalar and the NumPy evaluation for several batch sizes"""
+
+    if not batch_eval.is_numpy_available():
+        raise SystemExit('NumPy is not installed - nothing to compare')
+
+    positions = sample_positions(board_size_x, board_size_y, number_of_positions)
+    gameboard.use_board_size(board_size_x, board_size_y)
+
+    def material_scalar(batch):
+        return [
+            (wk.bit_count() - bk.bit_count()) * bot.POINTS_KING + (wp.bit_count() - bp.bit_count()) * bot.POINTS_PIECE
+            for wp, wk, bp, bk in batch
+        ]
+
+    def material_numpy(batch):
+        counts = batch_eval.piece_counts(batch)
+        return ((counts[:, 1] - counts[:, 3]) * bot.POINTS_KING + (counts[:, 0] - counts[:, 2]) * bot.POINTS_PIECE).tolist()
+
+    def mobility_scalar(batch):
+        return [[bot.estimate_mobility(*bitboard, True), bot.estimate_mobility(*bitboard, False)] for bitboard in batch]
+
+    def mobility_numpy(batch):
+        return batch_eval.mobility(batch).tolist()
+
+    assert material_scalar(positions) == material_numpy(positions), 'Scores of the NumPy path differ'
+    assert mobility_scalar(positions) == mobility_numpy(positions), 'Mobility of the NumPy path differs'
+
+    print(f'{board_size_x}x{board_size_y} board, {len(positions)} positions, microseconds per position\n')
+    print(f'{"batch":>6} | {"material":>8} {"numpy":>8} | {"mobility":>8} {"numpy":>8}')
+    crossover = {'material': None, 'mobility': None}
+    for batch_size in BATCH_SIZES:
+        batches = [positions[i:i + batch_size] for i in range(0, len(positions), batch_size)]
+        times = [
+            time_per_position(func, batches)
+            for func in (material_scalar, material_numpy, mobility_scalar, mobility_numpy)
+        ]
+        print(f'{batch_size:>6} | {times[0]:8.2f} {times[1]:8.2f} | {times[2]:8.2f} {times[3]:8.2f}')
+
+        if crossover['material'] is None and times[1] < times[0]:
+            crossover['material'] = batch_size
+        if crossover['mobility'] is None and times[3] < times[2]:
+            crossover['mobility'] = batch_size
+
+    print('\nNumPy is faster from batch size on:')
+    for name, batch_size in crossover.items():
+        print(f'  {name}: {batch_size if batch_size is not None else "never (up to " + str(BATCH_SIZES[-1]) + ")"}')
+
+
+def benchmark_perft(boards: list[tuple[int, int]], depth: int, positions_per_board: int) -> bool:
+    """Perft of the generic and the generated rule functions on initial and random positions\n
+    Return: True if all counts match"""
+
+    all_match = True
+    total_sec = {'generic': 0.0, 'generated': 0.0}
+    print(f'{"position":<48} {"perft":>10} {"generic n/s":>12} {"generated n/s":>14} {"speedup":>8}')
+
+    for board_size_x, board_size_y in boards:
+        initial = gameboard.create_bitboard_new_game(board_size_x, board_size_y)
+        positions = [initial] + sample_positions(board_size_x, board_size_y, 256 * positions_per_board)[511::256]
+        positions = positions[:positions_per_board] # Initial position + positions of random games
+        engine = codegen.get_engine(board_size_x, board_size_y)
+        if engine is None:
+            raise SystemExit(f'{board_size_x}x{board_size_y} is above the supported board size (max_board_size)')
+
+        for ply, bitboard in enumerate(positions):
+            moving_white = True
+            counts = {}
+            for name, specialised in (('generic', None), ('generated', engine)):
+                move_mgr.use_specialised(specialised)
+                start_time = time.perf_counter()
+                counts[name] = move_mgr.perft(*bitboard, moving_white, depth)
+                elapsed_sec = time.perf_counter() - start_time
+                total_sec[name] += elapsed_sec
+                counts[name + '_nps'] = counts[name] / elapsed_sec
+
+            match = counts['generic'] == counts['generated']
+            all_match &= match
+            text = notation.to_notation(board_size_x, board_size_y, *bitboard, moving_white)
+            print(f'{text[:47]:<48} {counts["generic"]:>10} {counts["generic_nps"]:>12.0f} '
+                  f'{counts["generated_nps"]:>14.0f} {counts["generated_nps"] / counts["generic_nps"]:>7.2f}x'
+                  + ('' if match else f'  MISMATCH (generated: {counts["generated"]})'))
+
+        move_mgr.use_specialised(engine if codegen.ENABLED else None)
+
+    print(f'\nTotal speedup: {total_sec["generic"] / total_sec["generated"]:.2f}x, '
+          f'{"all counts match" if all_match else "COUNTS DIFFER"}')
+    return all_match
+
+
+def benchmark_boards(boards: list[tuple[int, int]], positions_per_board: int, generic: bool):
+    """Bot searches with the configured limits of every board size (see `bot.get_search_limits`)
+    on the initial and random positions, without position cache"""
+
+    use_position_cache = bot.USE_POSITION_CACHE
+    bot.USE_POSITION_CACHE = False
+    print(f'{"board":>7} {"depth":>5} {"timeout":>7} | {"nodes":>9} {"nodes/s":>9} | '
+          f'{"latency mean":>12} {"max":>7} {"timeouts":>8}')
+
+    try:
+        for board_size_x, board_size_y in boards:
+            initial = gameboard.create_bitboard_new_game(board_size_x, board_size_y)
+            positions = [initial] + sample_positions(board_size_x, board_size_y, 256 * positions_per_board)[511::256]
+            gameboard.use_board_size(board_size_x, board_size_y)
+            if generic:
+                move_mgr.use_specialised(None)
+            positions = [
+                bitboard for bitboard in positions
+                if not any(rules.check_for_winner(*bitboard)) and move_mgr.find_legal_moves_on_bitboard(*bitboard, True)
+            ][:positions_per_board] # Initial position + positions of random games, white to move
+
+            nodes = 0
+            latencies = []
+            timeouts = 0
+            for bitboard in positions:
+                start_time = time.perf_counter()
+                _, _, stats = bot.find_move_for_bot(*bitboard, True, return_stats=True)
+                latencies.append(time.perf_counter() - start_time)
+                nodes += stats.nodes
+                timeouts += stats.timeout_reason is not None
+
+            max_depth, _, timeout_sec = bot.get_search_limits(board_size_x, board_size_y)
+            print(f'{f"{board_size_x}x{board_size_y}":>7} {max_depth:>5} {timeout_sec:>6g}s | '
+                  f'{nodes:>9} {nodes / sum(latencies):>9.0f} | '
+                  f'{sum(latencies) / len(latencies):>11.2f}s {max(latencies):>6.2f}s {timeouts:>8}')
+
+            move_mgr.use_specialised(codegen.get_engine(board_size_x, board_size_y) if codegen.ENABLED else None)
+    finally:
+        bot.USE_POSITION_CACHE = use_position_cache
+
+
+def sample_positions(board_size_x: int, board_size_y: int, number_of_positions: int) -> list[tuple[int, int, int, int]]:
+    """Positions of random games (all game phases)"""
+
+    sim = simulator.LockstepSimulator(board_size_x, board_size_y, 256, max_plies=120, seed=1)
+    positions = []
+    while len(positions) < number_of_positions:
+        sim.step()
+        positions.extend(zip(sim.white_pieces, sim.white_kings, sim.black_pieces, sim.black_kings))
+    return positions[:number_of_positions]
+
+
+def time_per_position(func, batches: list, repeat: int = 3) -> float:
+    """Best time of `repeat` runs in microseconds per position"""
+
+    number_of_positions = sum(len(batch) for batch in batches)
+    best = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for batch in batches:
+            func(batch)
+        best = min(best, time.perf_counter() - start_time)
+    return best / number_of_positions * 1e6
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+# gunicorn settings: gunicorn --config gunicorn.conf.py app:app (see README)
+import os
+
+bind = os.environ.get('LATRONES_BIND', '127.0.0.1:5000')
+
+# Games and bot jobs live in the memory of a web process: more than 1 process needs
+# sticky sessions at the load balancer, confirmed with LATRONES_STICKY_SESSIONS=1
+workers = int(os.environ.get('LATRONES_WEB_WORKERS', 1))
+sticky_sessions = os.environ.get('LATRONES_STICKY_SESSIONS') == '1'
+worker_class = 'gthread'
+threads = int(os.environ.get('LATRONES_WEB_THREADS', 16))
+
+# Bot replies are streamed for up to the bot's thinking time
+timeout = 0
+graceful_timeout = 10
+
+
+def on_starting(server):
+    """Refuse to start several web processes that would not share their games"""
+    if server.cfg.workers > 1 and not sticky_sessions:
+        raise SystemExit(
+            f'{server.cfg.workers} web workers need sticky sessions (games live in process memory): '
+            'route each client to one process and set LATRONES_STICKY_SESSIONS=1, or use 1 worker'
+        )
+    if server.cfg.workers > 1 and not os.environ.get('LATRONES_SECRET_KEY'):
+        raise SystemExit(f'{server.cfg.workers} web workers need the same LATRONES_SECRET_KEY')
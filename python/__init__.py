@@ -3,4 +3,15 @@ from . import move_manager as move_mgr
 from . import rules
 from . import gameboard
 from . import bot
-from . import global_variables as gl
\ No newline at end of file
+from . import global_variables as gl
+from . import cancellation
+from . import bot_jobs
+from . import game_store
+from . import position_cache
+from . import metrics
+from . import profiling
+from . import notation
+from . import game_log
+from . import simulator
+from . import batch_eval
+from . import codegen
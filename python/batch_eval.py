@@ -0,0 +1,124 @@
+from . import global_variables as gl
+
+# --------------------------------------------------------------------------
+# Evaluation of many positions at once (current board geometry), e.g. for the tuner
+#
+# Positions are converted to NumPy: every bitmask is split into 64-bit limbs (lowest
+# limb first), so boards of any size fit into a (positions, limbs) uint64 array.
+# Popcounts and occluded fills then run on all positions together.
+# NumPy is optional and only imported on first use.
+# --------------------------------------------------------------------------
+
+__numpy = None # Module after the first import attempt (False: not installed)
+
+
+def piece_counts(bitboards: list[tuple[int, int, int, int]]):
+    """Number of white pieces, white kings, black pieces and black kings of every position (needs NumPy)\n
+    Return: int64 array of shape (positions, 4)"""
+
+    np = __require_numpy()
+    limbs = to_limbs([mask for bitboard in bitboards for mask in bitboard])
+    return __popcount(np, limbs).reshape(len(bitboards), 4)
+
+
+def mobility(bitboards: list[tuple[int, int, int, int]]):
+    """Mobility of white and black in every position (same as `bot.estimate_mobility`, needs NumPy)\n
+    Return: int64 array of shape (positions, 2)"""
+
+    np = __require_numpy()
+    limbs = to_limbs([mask for bitboard in bitboards for mask in bitboard]).reshape(len(bitboards), 4, -1)
+    white = limbs[:, 0] | limbs[:, 1]
+    black = limbs[:, 2] | limbs[:, 3]
+    board_mask, left_col_mask, right_col_mask = to_limbs([gl.BOARD_MASK, gl.LEFT_COL_MASK, gl.RIGHT_COL_MASK])
+    empty = ~(white | black) & board_mask
+
+    result = np.empty((len(bitboards), 2), dtype=np.int64)
+    for column, my_pieces in enumerate((white, black)):
+        result[:, column] = (
+            __popcount(np, __reachable(np, my_pieces, empty & ~left_col_mask, 1, gl.BOARD_SIZE_X)) +
+            __popcount(np, __reachable(np, my_pieces, empty & ~right_col_mask, -1, gl.BOARD_SIZE_X)) +
+            __popcount(np, __reachable(np, my_pieces, empty, gl.BOARD_SIZE_X, gl.BOARD_SIZE_Y)) +
+            __popcount(np, __reachable(np, my_pieces, empty, -gl.BOARD_SIZE_X, gl.BOARD_SIZE_Y))
+        )
+    return result
+
+
+def to_limbs(masks: list[int]):
+    """Split bitmasks of the current board into 64-bit limbs (needs NumPy)\n
+    Return: uint64 array of shape (masks, limbs)"""
+
+    np = __require_numpy()
+    number_of_limbs = (gl.BOARD_SIZE_X * gl.BOARD_SIZE_Y + 63) // 64
+    data = b''.join(mask.to_bytes(8 * number_of_limbs, 'little') for mask in masks)
+    return np.frombuffer(data, dtype='<u8').astype(np.uint64).reshape(len(masks), number_of_limbs)
+
+
+def is_numpy_available() -> bool:
+    return __get_numpy() is not None
+
+
+def __get_numpy():
+    """Helper function: Import NumPy on first use\n
+    Return: numpy module (None if not installed)"""
+
+    global __numpy
+
+    if __numpy is None:
+        try:
+            import numpy
+            __numpy = numpy
+        except ImportError:
+            __numpy = False
+    return __numpy or None
+
+
+def __require_numpy():
+    np = __get_numpy()
+    if np is None:
+        raise ImportError('NumPy is required for the vectorised evaluation (pip install numpy)')
+    return np
+
+
+def __popcount(np, limbs):
+    """Helper function: Set bits per row of a limb array"""
+
+    if hasattr(np, 'bitwise_count'): # NumPy >= 2.0
+        return np.bitwise_count(limbs).sum(axis=-1, dtype=np.int64)
+    return np.unpackbits(limbs.view(np.uint8), axis=-1).sum(axis=-1, dtype=np.int64)
+
+
+def __shift(np, limbs, bits: int):
+    """Helper function: Shift limb arrays as one number (bits > 0: towards higher squares)"""
+
+    shifted = np.zeros_like(limbs)
+    number_of_limbs = limbs.shape[-1]
+    limb_shift, bit_shift = divmod(abs(bits), 64)
+    if limb_shift >= number_of_limbs:
+        return shifted
+
+    if bits > 0:
+        source = limbs[..., :number_of_limbs - limb_shift]
+        shifted[..., limb_shift:] = source << np.uint64(bit_shift)
+        if bit_shift:
+            shifted[..., limb_shift + 1:] |= source[..., :-1] >> np.uint64(64 - bit_shift)
+    else:
+        source = limbs[..., limb_shift:]
+        shifted[..., :number_of_limbs - limb_shift] = source >> np.uint64(bit_shift)
+        if bit_shift:
+            shifted[..., :number_of_limbs - limb_shift - 1] |= source[..., 1:] << np.uint64(64 - bit_shift)
+    return shifted
+
+
+def __reachable(np, gen, pro, step: int, line_length: int):
+    """Helper function: Set-wise occluded fill (Kogge-Stone) like `gameboard.reachable_*`\n
+    - step: shift of one square in the direction (1: right, -1: left, X: down, -X: up)
+    - line_length: squares along the direction (X or Y)\n
+    Return: empty squares reachable by any piece in `gen`"""
+
+    propagator = pro
+    steps = 1
+    while steps < line_length:
+        gen = gen | (propagator & __shift(np, gen, steps * step))
+        propagator = propagator & __shift(np, propagator, steps * step)
+        steps <<= 1
+    return __shift(np, gen, step) & pro
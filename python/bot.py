@@ -2,10 +2,12 @@ from . import global_variables as gl
 from . import gameboard
 from . import move_manager as move_mgr 
 from . import rules
+from . import time_manager as time_mgr
+from . import position_cache
+from .cancellation import CancellationToken, SearchCancelled, REASON_TIMEOUT
+from .search_stats import SearchStats
 
-import cProfile, pstats, io, time
-
-no_minmax_calls = 0
+import time
 
 POINTS_KING = gl.CONFIG["minimax_points_per_king_capture"] # Number of points to gain by the capture of the king
 POINTS_PIECE = gl.CONFIG["minimax_points_per_piece_capture"] # Number of points to gain by any captured piece
@@ -14,6 +16,8 @@ POINTS_MOVE_OPTION = gl.CONFIG["minimax_points_per_move_option"] # Number of poi
 MAX_DEPTH = gl.CONFIG["minimax_max_depth"] # Max depth at normal situation
 MAX_DEPTH_CAPTURE = gl.CONFIG["minimax_max_depth_capture"] # Max depth if capture happens
 TIMEOUT_SEC = gl.CONFIG["minimax_timeout_sec"] # Timeout - Break minimax search after X seconds
+LIMITS_BY_BOARD_SIZE = gl.CONFIG["minimax_limits_by_board_size"] # Overrides of the limits above from a number of squares on
+USE_POSITION_CACHE = gl.CONFIG["position_cache_enabled"] # Reuse results of positions searched before (any game)
 
 
 def find_move_for_bot(
@@ -21,24 +25,38 @@ def find_move_for_bot(
         white_kings: int,
         black_pieces: int,
         black_kings: int,
-        moving_white: bool
+        moving_white: bool,
+        remaining_time_sec: float = None,
+        increment_sec: float = 0.0,
+        cancel_token: CancellationToken = None,
+        on_iteration = None,
+        max_depth: int = None,
+        max_time_sec: float = None,
+        return_stats: bool = False
     ) -> tuple[int, int]:
     """Calculate the best bot move given a board state \n
-    Return: cur_mask, dst_mask"""
+    The time for the move is allocated from the bot's remaining clock (if given), 
+    capped by the configured timeout.\n
+    `max_depth` and `max_time_sec` lower the configured limits (e.g. under load).\n
+    Raises `SearchCancelled` if `cancel_token` is cancelled during the search.\n
+    `on_iteration(depth, (cur_mask, dst_mask), score)` is called after every completed iteration.\n
+    Return: cur_mask, dst_mask (and the `SearchStats` of the search if `return_stats`)"""
 
-    global no_minmax_calls, MAX_DEPTH, TIMEOUT_SEC, MAX_DEPTH_CAPTURE
-    no_minmax_calls = 0
+    stats = SearchStats()
 
     if gl.DEBUG_MODE:
         start_time = time.time()
 
-        if gl.DEBUG_ANALYZE_MINIMAX_TIME:
-            profiler = cProfile.Profile()
-            profiler.enable()
-
-    max_depth = MAX_DEPTH 
-    timeout_sec = TIMEOUT_SEC
-    max_depth_capture = MAX_DEPTH_CAPTURE
+    configured_depth, max_depth_capture, timeout_sec = get_search_limits(gl.BOARD_SIZE_X, gl.BOARD_SIZE_Y)
+    max_depth = configured_depth if max_depth is None else min(max_depth, configured_depth)
+    time_manager = time_mgr.create_time_manager(
+        timeout_sec if max_time_sec is None else min(max_time_sec, timeout_sec),
+        remaining_time_sec,
+        increment_sec
+    )
+    if cancel_token is None:
+        cancel_token = CancellationToken()
+    cancel_token.set_deadline(time_manager.start_time + time_manager.hard_limit_sec)
 
     white_wins, black_wins = rules.check_for_winner(
         white_pieces, 
@@ -50,31 +68,73 @@ def find_move_for_bot(
         raise ValueError(f'Someone won: {white_wins=}, {black_wins=}')
 
     is_white_maximized = moving_white
-    cur_mask, dst_mask = __iterative_deepening_minimax(
+    cached = None
+    if USE_POSITION_CACHE:
+        cached = position_cache.lookup(
+            white_pieces, white_kings,
+            black_pieces, black_kings,
+            moving_white,
+            min_depth=max_depth
+        )
+    if cached is not None:
+        (cur_mask, dst_mask), best_score, searched_depth = cached
+        stats.cache_hit = True
+        stats.add_iteration(searched_depth, (cur_mask, dst_mask), best_score)
+        stats.finish()
+        if on_iteration is not None:
+            on_iteration(searched_depth, (cur_mask, dst_mask), best_score)
+        return (cur_mask, dst_mask, stats) if return_stats else (cur_mask, dst_mask)
+
+    (cur_mask, dst_mask), best_score, searched_depth = __iterative_deepening_minimax(
         white_pieces, white_kings,
         black_pieces, black_kings,
         moving_white,
         max_depth,
         max_depth_capture,
         is_white_maximized,
-        timeout_sec
+        time_manager,
+        cancel_token,
+        on_iteration,
+        stats
     )
+    stats.finish()
+
+    if USE_POSITION_CACHE and searched_depth > 0:
+        position_cache.store(
+            white_pieces, white_kings,
+            black_pieces, black_kings,
+            moving_white,
+            (cur_mask, dst_mask),
+            best_score,
+            searched_depth
+        )
 
     if gl.DEBUG_MODE:
         elapsed_time = time.time() - start_time
-
-        if gl.DEBUG_ANALYZE_MINIMAX_TIME:
-            print('\ncProfile:\n')
-            profiler.disable()
-            stream = io.StringIO()
-            stats = pstats.Stats(profiler, stream=stream).sort_stats("cumulative")
-            stats.print_stats(30)  # Print top 30 lines
-            print(stream.getvalue())
-
         print(f"\nBot move calculation took {elapsed_time:.3f} seconds.")
-        print(f'Number of Minmax Calls: {no_minmax_calls}\n')
-
-    return cur_mask, dst_mask
+        print(f'Number of Minmax Calls: {stats.nodes} '
+              f'(quiescence: {stats.quiescence_nodes}, cutoffs: {stats.cutoffs}, '
+              f'first move cutoffs: {stats.first_move_cutoff_rate():.0%})\n')
+
+    return (cur_mask, dst_mask, stats) if return_stats else (cur_mask, dst_mask)
+
+
+def get_search_limits(board_size_x: int, board_size_y: int) -> tuple[int, int, float]:
+    """Configured search limits of a board size: `minimax_max_depth`, `minimax_max_depth_capture` and
+    `minimax_timeout_sec`, overridden by the values of the rows of `minimax_limits_by_board_size`
+    whose `min_squares` the board reaches (later rows win)\n
+    Return: max_depth, max_depth_capture, timeout_sec"""
+
+    number_of_squares = board_size_x * board_size_y
+    limits = {}
+    for row in LIMITS_BY_BOARD_SIZE:
+        if number_of_squares >= row["min_squares"]:
+            limits.update(row)
+    return (
+        limits.get("max_depth", MAX_DEPTH),
+        limits.get("max_depth_capture", MAX_DEPTH_CAPTURE),
+        limits.get("timeout_sec", TIMEOUT_SEC)
+    )
 
 
 def __iterative_deepening_minimax(
@@ -86,10 +146,14 @@ def __iterative_deepening_minimax(
         max_depth: int,
         max_depth_capture: int,
         is_white_maximized: bool,
-        timeout_sec: float
-    ) -> tuple[int, int]:
+        time_manager: time_mgr.TimeManager,
+        cancel_token: CancellationToken,
+        on_iteration,
+        stats: SearchStats
+    ) -> tuple[tuple[int, int], float, int]:
     """Conduct minmax algorithm iterativaly increasing the depth\n
-    Return: best move --> (cur_mask, dst_mask)
+    Return: best move --> (cur_mask, dst_mask), its score and the depth of the last completed iteration 
+    (score None and depth 0 if nothing was searched)
     """
 
     ordered_moves = move_mgr.find_legal_moves_on_bitboard(
@@ -97,20 +161,33 @@ def __iterative_deepening_minimax(
         black_pieces, black_kings,
         moving_white
     )
+    ordered_moves = __deduplicate_symmetric_moves(
+        white_pieces, white_kings,
+        black_pieces, black_kings,
+        ordered_moves
+    )
     best_move = ordered_moves[0]
-    start_time = time.time()
+    best_score = None
+    searched_depth = 0
+
+    if len(ordered_moves) == 1:
+        return best_move, best_score, searched_depth # Forced move - nothing to search
 
     for depth in range(max_depth-1, -1, -1):
-        best_score = float('-inf')
+        if depth < max_depth-1 and not time_manager.should_start_iteration():
+            break # Best move is stable or soft time limit reached
+
+        temp_best_score = float('-inf')
         temp_best_move = None
         scored_moves = []
 
         for move in ordered_moves:
             cur_mask, dst_mask = move
             
-            if time.time() - start_time > timeout_sec and best_move is not None:
+            if time_manager.is_hard_limit_reached() and best_move is not None:
                 print(f'Timeout caused stop of minmax at a depth of {depth}')
-                return best_move
+                stats.timeout_reason = REASON_TIMEOUT
+                return best_move, best_score, searched_depth
 
             (white_pieces_new, white_kings_new, 
              black_pieces_new, black_kings_new, 
@@ -121,22 +198,31 @@ def __iterative_deepening_minimax(
             )
             moving_white_new = not moving_white
 
-            score_captures = __minimax_alpha_beta_prune(
-                white_pieces_new,
-                white_kings_new,
-                black_pieces_new,
-                black_kings_new,
-                moving_white_new,
-                depth=depth + 1,  # because we just made a move
-                alpha=float('-inf'),
-                beta=float('inf'),
-                is_white_maximized=is_white_maximized,
-                max_depth = max_depth,
-                max_depth_capture = max_depth_capture,
-                capture_chain_active = bool(captured_mask)
-            )
+            try:
+                score_captures = __minimax_alpha_beta_prune(
+                    white_pieces_new,
+                    white_kings_new,
+                    black_pieces_new,
+                    black_kings_new,
+                    moving_white_new,
+                    depth=depth + 1,  # because we just made a move
+                    alpha=float('-inf'),
+                    beta=float('inf'),
+                    is_white_maximized=is_white_maximized,
+                    max_depth = max_depth,
+                    max_depth_capture = max_depth_capture,
+                    capture_chain_active = bool(captured_mask),
+                    cancel_token = cancel_token,
+                    stats = stats
+                )
+            except SearchCancelled:
+                stats.timeout_reason = cancel_token.reason
+                if cancel_token.reason != REASON_TIMEOUT:
+                    raise # Search is not needed anymore
+                print(f'Timeout caused stop of minmax at a depth of {depth}')
+                return best_move, best_score, searched_depth
 
-            score_mobility = __evaluate_move_by_mobility(
+            score_mobility = evaluate_mobility(
                 white_pieces_new, white_kings_new,
                 black_pieces_new, black_kings_new,
                 is_white_maximized
@@ -145,13 +231,44 @@ def __iterative_deepening_minimax(
 
             scored_moves.append((move, total_score))
 
-            if total_score > best_score:
-                best_score = total_score
+            if total_score > temp_best_score:
+                temp_best_score = total_score
                 temp_best_move = move
 
         best_move = temp_best_move
+        best_score = temp_best_score
+        searched_depth = max_depth - depth
+        stats.add_iteration(searched_depth, best_move, best_score)
+        time_manager.register_iteration(best_move, best_score)
+        if on_iteration is not None:
+            on_iteration(searched_depth, best_move, best_score)
         ordered_moves = [move for move, _ in sorted(scored_moves, key=lambda x: x[1], reverse=True)]
-    return best_move
+    return best_move, best_score, searched_depth
+
+
+def __deduplicate_symmetric_moves(
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
+        moves: list[tuple[int, int]]
+    ) -> list[tuple[int, int]]:
+    """Drop moves that are the left-right reflection of an earlier move, 
+    if the position is symmetric (both moves lead to equivalent subtrees)"""
+
+    if not gameboard.is_horizontally_symmetric(white_pieces, white_kings, black_pieces, black_kings):
+        return moves
+
+    unique_moves = []
+    seen = set()
+    for cur_mask, dst_mask in moves:
+        mirrored_move = (gameboard.mirror_horizontal(cur_mask), gameboard.mirror_horizontal(dst_mask))
+        if mirrored_move in seen:
+            continue
+        seen.add((cur_mask, dst_mask))
+        unique_moves.append((cur_mask, dst_mask))
+
+    return unique_moves
 
 
 def __minimax_alpha_beta_prune(
@@ -167,11 +284,17 @@ def __minimax_alpha_beta_prune(
         max_depth: int, # Absolute maximum depth allowed
         max_depth_capture: int, # Extended max. depth for captures
         capture_chain_active: bool, # Extended search when capture occurs
+        cancel_token: CancellationToken, # Stops the search (raises SearchCancelled)
+        stats: SearchStats, # Counters of the search
     ) -> int:
     """Minmax algorithm applying alpha beta pruning with extended search if capture occurs\n"""
     
-    global no_minmax_calls
-    no_minmax_calls += 1
+    stats.nodes += 1
+    if depth > max_depth:
+        stats.quiescence_nodes += 1
+
+    if cancel_token.is_cancelled():
+        raise SearchCancelled(cancel_token.reason)
 
     white_wins, black_wins = rules.check_for_winner(
         white_pieces, white_kings, 
@@ -198,6 +321,9 @@ def __minimax_alpha_beta_prune(
             evaluate = True # "Quiet" position reached at capture search extension
             capture_chain_active = False
 
+    if depth == max_depth and not evaluate:
+        stats.extensions += 1 # Capture at the normal max. depth: search goes on
+
     # Evaluate move
     if evaluate:
         eval = __evaluate_move_by_captures(
@@ -214,11 +340,27 @@ def __minimax_alpha_beta_prune(
         moving_white,
     )
 
+    if depth + 1 >= max_depth:
+        return __minimax_frontier(
+            white_pieces, white_kings,
+            black_pieces, black_kings,
+            moving_white,
+            legal_moves,
+            depth=depth,
+            alpha=alpha,
+            beta=beta,
+            is_white_maximized=is_white_maximized,
+            max_depth=max_depth,
+            max_depth_capture=max_depth_capture,
+            cancel_token=cancel_token,
+            stats=stats
+        )
+
     # Iterrative moving, deepening and evaluation
     is_maximizing_turn = (moving_white == is_white_maximized)
     if is_maximizing_turn:
         max_eval = float('-inf')
-        for move in legal_moves:
+        for move_index, move in enumerate(legal_moves):
             cur_mask, dst_mask = move
 
             # Apply move
@@ -242,16 +384,20 @@ def __minimax_alpha_beta_prune(
                 is_white_maximized=is_white_maximized,
                 max_depth = max_depth,
                 max_depth_capture = max_depth_capture,
-                capture_chain_active = bool(captured_mask)
+                capture_chain_active = bool(captured_mask),
+                cancel_token = cancel_token,
+                stats = stats
             )
             max_eval = max(max_eval, eval)
             alpha = max(alpha, eval)
             if beta <= alpha:
+                stats.cutoffs += 1
+                stats.first_move_cutoffs += (move_index == 0)
                 break
         return max_eval
     else:
         min_eval = float('inf')
-        for move in legal_moves:
+        for move_index, move in enumerate(legal_moves):
             cur_mask, dst_mask = move
 
             # Apply move
@@ -276,15 +422,110 @@ def __minimax_alpha_beta_prune(
                 is_white_maximized=is_white_maximized,
                 max_depth = max_depth,
                 max_depth_capture = max_depth_capture,
-                capture_chain_active = bool(captured_mask)
+                capture_chain_active = bool(captured_mask),
+                cancel_token = cancel_token,
+                stats = stats
             )
             min_eval = min(min_eval, eval)
             beta = min(beta, eval)
             if beta <= alpha:
+                stats.cutoffs += 1
+                stats.first_move_cutoffs += (move_index == 0)
                 break
         return min_eval
 
 
+def __minimax_frontier(
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
+        moving_white: bool,
+        legal_moves: list[tuple[int, int]],
+        depth: int,
+        alpha: float,
+        beta: float,
+        is_white_maximized: bool,
+        max_depth: int,
+        max_depth_capture: int,
+        cancel_token: CancellationToken,
+        stats: SearchStats,
+    ) -> int:
+    """Minimax step of a node whose children reach the max. depth.\n
+    Children without capture are leaves and evaluated by material. Children with capture are searched further.\n
+    A leaf without capture keeps the material of this node: only king moves and moves to `rules.find_capture_squares`
+    are applied, all other leaves share one score (a few big-int operations per move, also on large boards)."""
+
+    is_maximizing_turn = (moving_white == is_white_maximized)
+    best_eval = float('-inf') if is_maximizing_turn else float('inf')
+    capture_squares = rules.find_capture_squares(
+        white_pieces, white_kings,
+        black_pieces, black_kings,
+        moving_white
+    )
+    my_kings = white_kings if moving_white else black_kings
+    quiet_score = None # Score of every leaf without capture (computed on first use)
+
+    for move_index, (cur_mask, dst_mask) in enumerate(legal_moves):
+        if dst_mask & capture_squares or cur_mask & my_kings:
+            (white_pieces_new, white_kings_new,
+             black_pieces_new, black_kings_new,
+             captured_mask) = move_mgr.apply_move(
+                white_pieces, white_kings,
+                black_pieces, black_kings,
+                cur_mask, dst_mask
+            )
+        else:
+            captured_mask = 0 # Move can't capture (no need to apply it)
+
+        if captured_mask and depth + 1 < max_depth_capture:
+            eval = __minimax_alpha_beta_prune(
+                white_pieces_new, white_kings_new,
+                black_pieces_new, black_kings_new,
+                not moving_white,
+                depth=depth + 1,
+                alpha=alpha,
+                beta=beta,
+                is_white_maximized=is_white_maximized,
+                max_depth=max_depth,
+                max_depth_capture=max_depth_capture,
+                capture_chain_active=True,
+                cancel_token=cancel_token,
+                stats=stats
+            )
+        else:
+            stats.nodes += 1
+            if depth + 1 > max_depth:
+                stats.quiescence_nodes += 1
+            if captured_mask:
+                eval = __evaluate_move_by_captures(
+                    white_pieces_new, white_kings_new,
+                    black_pieces_new, black_kings_new,
+                    is_white_maximized
+                )
+            elif quiet_score is None:
+                eval = quiet_score = __evaluate_move_by_captures(
+                    white_pieces, white_kings,
+                    black_pieces, black_kings,
+                    is_white_maximized
+                )
+            else:
+                continue # Same score as an earlier leaf: no new bound
+
+        if is_maximizing_turn:
+            best_eval = max(best_eval, eval)
+            alpha = max(alpha, eval)
+        else:
+            best_eval = min(best_eval, eval)
+            beta = min(beta, eval)
+        if beta <= alpha:
+            stats.cutoffs += 1
+            stats.first_move_cutoffs += (move_index == 0)
+            return best_eval
+
+    return best_eval
+
+
 def __evaluate_move_by_captures(
         white_pieces_aftermove: int,
         white_kings_aftermove: int,
@@ -315,77 +556,58 @@ def __evaluate_move_by_captures(
     return score
 
 
-def __evaluate_move_by_mobility(
-        white_pieces_aftermove: int,
-        white_kings_aftermove: int,
-        black_pieces_aftermove: int,
-        black_kings_aftermove: int,
+def evaluate_mobility(
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
         is_white_maximized: bool,
-    ):
-    """Get a score correction based on the mobility after move"""
-    
-    global POINTS_MOVE_OPTION
-    score = 0
+    ) -> int:
+    """Evaluation term: Score correction based on the mobility of both colors"""
 
-    mobility_white = __estimate_mobility(
-        white_pieces_aftermove,
-        white_kings_aftermove,
-        black_pieces_aftermove,
-        black_kings_aftermove,
+    mobility_white = estimate_mobility(
+        white_pieces, white_kings,
+        black_pieces, black_kings,
         mycolor_is_white=True
     )
-    mobility_black = __estimate_mobility(
-        white_pieces_aftermove,
-        white_kings_aftermove,
-        black_pieces_aftermove,
-        black_kings_aftermove,
+    mobility_black = estimate_mobility(
+        white_pieces, white_kings,
+        black_pieces, black_kings,
         mycolor_is_white=False
     )
-    white_mobility_points = mobility_white * POINTS_MOVE_OPTION
-    black_mobility_points = mobility_black * POINTS_MOVE_OPTION
+    score = (mobility_white - mobility_black) * POINTS_MOVE_OPTION
 
-    if is_white_maximized:
-        score += white_mobility_points - black_mobility_points
-    else:
-        score -= white_mobility_points - black_mobility_points
-
-    return score
+    return score if is_white_maximized else -score
 
 
-def __estimate_mobility(
+def estimate_mobility(
     white_pieces: int,
     white_kings: int,
     black_pieces: int,
     black_kings: int,
     mycolor_is_white: bool
 ) -> int:
-    """Estimate number of orthogonal positions all pieces of a color can access."""
+    """Estimate number of orthogonal positions all pieces of a color can access.\n
+    All pieces of the color are moved at once with an occluded fill per direction. Along one 
+    direction every empty square is reached by at most one piece, so the popcount of the fills 
+    equals the sum of the individual ray lengths."""
+
+    specialised = move_mgr.get_specialised()
+    if specialised is not None:
+        return specialised.estimate_mobility(
+            white_pieces, white_kings, black_pieces, black_kings, mycolor_is_white
+        )
 
     all_pieces = white_pieces | white_kings | black_pieces | black_kings
     my_pieces = white_pieces | white_kings if mycolor_is_white else black_pieces | black_kings
+    empty = ~all_pieces & gl.BOARD_MASK
 
-    mobility = 0
-
-    pieces = my_pieces
-    while pieces:
-        cur_mask = pieces & -pieces  # Isolate lowest bit
-
-        for shift_func in (
-            gameboard.shift_right, gameboard.shift_left,
-            gameboard.shift_down, gameboard.shift_up,
-        ):
-            shifted = cur_mask
-            while True:
-                shifted = shift_func(shifted)
-                if shifted == 0 or (shifted & gl.BOARD_MASK) == 0:
-                    break  # Off board
-                if shifted & all_pieces:
-                    break  # Blocked by a piece
-                mobility += 1
-
-        pieces ^= cur_mask  # Remove processed piece
-
-    return mobility
+    return (
+        gameboard.reachable_right(my_pieces, empty).bit_count() +
+        gameboard.reachable_left(my_pieces, empty).bit_count() +
+        gameboard.reachable_down(my_pieces, empty).bit_count() +
+        gameboard.reachable_up(my_pieces, empty).bit_count()
+    )
 
 
 def __is_noisy_position(
@@ -406,9 +628,17 @@ def __is_noisy_position(
         black_kings,
         moving_white
     )
+    capture_squares = rules.find_capture_squares(
+        white_pieces, white_kings,
+        black_pieces, black_kings,
+        moving_white
+    )
+    my_kings = white_kings if moving_white else black_kings
 
     for move in legal_moves:
         cur_mask, dst_mask = move
+        if not (dst_mask & capture_squares or cur_mask & my_kings):
+            continue # Move can't capture
 
         (white_pieces_new, white_kings_new,
          black_pieces_new, black_kings_new, 
@@ -0,0 +1,434 @@
+from . import global_variables as gl
+from . import gameboard
+from . import move_manager as move_mgr
+from . import bot
+from . import cancellation
+from . import metrics
+from . import profiling
+from .cancellation import CancellationToken, SearchCancelled
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import atexit, multiprocessing, threading, time, uuid
+
+MAX_WORKERS = gl.CONFIG["bot_max_workers"] # Number of bot searches running in parallel (processes)
+MAX_QUEUED_JOBS = gl.CONFIG["bot_max_queued_jobs"] # Max. number of jobs waiting for a free worker
+JOB_RETENTION_SEC = gl.CONFIG["bot_job_retention_sec"] # Finished jobs are forgotten after X seconds
+QUEUE_DEADLINE_SEC = gl.CONFIG["bot_queue_deadline_sec"] # Jobs waiting longer only get a minimal search
+MIN_SEARCH_TIME_SEC = gl.CONFIG["bot_min_search_time_sec"] # Time budget of a search at the highest load
+WAIT_TIME_SAMPLES = 100 # Number of recent queue wait times kept for the stats
+CANCEL_POLL_INTERVAL = 256 # Nodes between two checks of the (inter-process) cancel event
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_CANCELLED = 'cancelled'
+STATUS_FAILED = 'failed'
+
+
+class JobQueueFull(Exception):
+    """Raised when too many bot jobs are waiting"""
+
+
+@dataclass
+class BotJob:
+    """State of a bot move search running in the background"""
+    job_id: str
+    game_id: str
+    board_size_x: int
+    board_size_y: int
+    bitboard: tuple[int, int, int, int]
+    moving_white: bool
+    remaining_time_sec: float = None
+    increment_sec: float = 0.0
+    time_limit_sec: float = None # Requested limit of the search time (None: configured limit)
+    on_done: object = field(default=None, repr=False)
+    cancel_token: CancellationToken = None
+    status: str = STATUS_QUEUED
+    iterations: list = field(default_factory=list) # [{'depth', 'cur_mask', 'dst_mask', 'score'}, ...]
+    result: dict = None # {'cur_mask', 'dst_mask', 'bitboard', 'white_wins', 'black_wins', 'stats'}
+    error: str = None
+    version: int = 0 # Increased with every update
+    created_time: float = field(default_factory=time.time)
+    dispatched_time: float = None # Left the queue
+    finished_time: float = None
+    max_depth: int = None # Search limits lowered by the scheduler (None: configured limits)
+    max_time_sec: float = None
+    profile_mode: str = None # Profiler of the search (see profiling.MODES, None: not profiled)
+
+    def is_degraded(self) -> bool:
+        """Check if the scheduler lowered the search limits (load)"""
+        return self.max_depth is not None or (
+            self.max_time_sec is not None and self.max_time_sec != self.time_limit_sec)
+
+    def wait_sec(self) -> float:
+        """Time the job waited (or is waiting) for a free worker"""
+        end_time = self.dispatched_time or self.finished_time or time.time()
+        return end_time - self.created_time
+
+    def is_finished(self) -> bool:
+        return self.status in (STATUS_DONE, STATUS_CANCELLED, STATUS_FAILED)
+
+
+__jobs: dict[str, BotJob] = {}
+__jobs_changed = threading.Condition()
+__waiting_jobs: deque[BotJob] = deque() # Jobs waiting for a free worker (FIFO)
+__running_jobs = 0
+__wait_times: deque[float] = deque(maxlen=WAIT_TIME_SAMPLES)
+__executor = None
+__manager = None
+__progress_queue = None
+
+
+def submit(
+        game_id: str,
+        board_size_x: int,
+        board_size_y: int,
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
+        moving_white: bool,
+        remaining_time_sec: float = None,
+        increment_sec: float = 0.0,
+        on_done = None,
+        profile_mode: str = None,
+        max_time_sec: float = None
+    ) -> BotJob:
+    """Start the search of a bot move in the background\n
+    At most `MAX_WORKERS` searches run at the same time, further jobs wait in a queue. 
+    The longer the queue, the less time a search gets (see `__get_search_limits`).\n
+    Raises `JobQueueFull` if `MAX_QUEUED_JOBS` jobs are already waiting.\n
+    `on_done(job)` is called with the found move before the job is marked as done.\n
+    `profile_mode` profiles the search; otherwise it may be sampled (see `profiling.set_sampling`).\n
+    `max_time_sec` lowers the time limit of the search (the scheduler may lower it further).\n
+    Return: the job (poll it with `get_job` or wait for updates with `wait_for_update`)"""
+
+    __start_executor()
+    __forget_old_jobs()
+
+    with __jobs_changed:
+        if len(__waiting_jobs) >= MAX_QUEUED_JOBS:
+            raise JobQueueFull(f'{MAX_QUEUED_JOBS} bot jobs are already waiting.')
+
+        job = BotJob(
+            job_id=uuid.uuid4().hex,
+            game_id=game_id,
+            board_size_x=board_size_x,
+            board_size_y=board_size_y,
+            bitboard=(white_pieces, white_kings, black_pieces, black_kings),
+            moving_white=moving_white,
+            remaining_time_sec=remaining_time_sec,
+            increment_sec=increment_sec,
+            time_limit_sec=max_time_sec,
+            on_done=on_done,
+            profile_mode=profiling.choose_mode(profile_mode),
+            cancel_token=CancellationToken(__manager.Event(), poll_interval=CANCEL_POLL_INTERVAL)
+        )
+        __jobs[job.job_id] = job
+        cancellation.register(game_id, job.cancel_token)
+
+        __waiting_jobs.append(job)
+        __dispatch_jobs()
+
+    return job
+
+
+def get_job(job_id: str) -> BotJob:
+    """Return the job with the given id (None if unknown)"""
+    with __jobs_changed:
+        return __jobs.get(job_id)
+
+
+def wait_for_update(job: BotJob, known_version: int, timeout_sec: float) -> bool:
+    """Block until the job has a newer version than `known_version` or the timeout passed\n
+    Return: True if the job was updated"""
+
+    with __jobs_changed:
+        return __jobs_changed.wait_for(lambda: job.version > known_version, timeout_sec)
+
+
+def wait_for_any(jobs: list[BotJob], timeout_sec: float) -> bool:
+    """Block until one of the jobs is finished or the timeout passed\n
+    Return: True if a job is finished"""
+
+    with __jobs_changed:
+        return __jobs_changed.wait_for(lambda: any(job.is_finished() for job in jobs), timeout_sec)
+
+
+def get_stats() -> dict:
+    """Load of the scheduler: queue depth, running searches and recent queue wait times"""
+
+    with __jobs_changed:
+        wait_times = sorted(__wait_times)
+        return {
+            'queued': len(__waiting_jobs),
+            'running': __running_jobs,
+            'max_workers': MAX_WORKERS,
+            'max_queued_jobs': MAX_QUEUED_JOBS,
+            'wait_sec_avg': sum(wait_times) / len(wait_times) if wait_times else 0.0,
+            'wait_sec_max': wait_times[-1] if wait_times else 0.0,
+            'wait_sec_p99': wait_times[min(int(0.99 * len(wait_times)), len(wait_times) - 1)] if wait_times else 0.0,
+        }
+
+
+def shutdown():
+    """Cancel all jobs and stop the worker processes"""
+
+    global __executor, __manager
+    cancellation.cancel_all(cancellation.REASON_SHUTDOWN)
+    with __jobs_changed:
+        while __waiting_jobs:
+            __set_finished(__waiting_jobs.popleft(), STATUS_CANCELLED)
+    if __executor is not None:
+        __executor.shutdown(wait=False, cancel_futures=True)
+        __executor = None
+    if __manager is not None:
+        __manager.shutdown()
+        __manager = None
+
+
+def __start_executor():
+    """Start worker processes, manager (for shared events) and progress listener on first use"""
+
+    global __executor, __manager, __progress_queue
+
+    with __jobs_changed:
+        if __executor is not None:
+            return
+
+        # Spawn fresh processes: Forking a multi-threaded web server is not safe
+        context = multiprocessing.get_context('spawn')
+        __manager = context.Manager()
+        __progress_queue = __manager.Queue()
+        __executor = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=context)
+
+        threading.Thread(target=__listen_for_progress, args=(__progress_queue,), daemon=True).start()
+        atexit.register(shutdown)
+
+
+def __dispatch_jobs():
+    """Move waiting jobs to free workers, with search limits according to the load (lock must be held)"""
+
+    global __running_jobs
+
+    while __waiting_jobs and __running_jobs < MAX_WORKERS:
+        job = __waiting_jobs.popleft()
+        if job.cancel_token.is_cancelled():
+            cancellation.unregister(job.game_id, job.cancel_token)
+            __set_finished(job, STATUS_CANCELLED)
+            continue
+
+        job.dispatched_time = time.time()
+        job.max_depth, job.max_time_sec = __get_search_limits(
+            job.wait_sec(),
+            len(__waiting_jobs),
+            bot.get_search_limits(job.board_size_x, job.board_size_y)[2]
+        )
+        if job.time_limit_sec is not None:
+            job.max_time_sec = min(job.max_time_sec or job.time_limit_sec, job.time_limit_sec)
+        __wait_times.append(job.wait_sec())
+
+        future = __executor.submit(
+            __search_job,
+            job.job_id,
+            job.board_size_x,
+            job.board_size_y,
+            job.bitboard,
+            job.moving_white,
+            job.remaining_time_sec,
+            job.increment_sec,
+            job.max_depth,
+            job.max_time_sec,
+            job.profile_mode,
+            job.cancel_token,
+            __progress_queue
+        )
+        __running_jobs += 1
+        future.add_done_callback(lambda future, job=job: __finish_job(job, future))
+
+
+def __get_search_limits(wait_sec: float, queued: int, timeout_sec: float) -> tuple[int, float]:
+    """Degrade the search under load:
+    - Queue deadline passed: depth 1 within the minimal time (answer as fast as possible)
+    - Jobs still waiting: the time budget shrinks with the queue length 
+      (each queued job has to share the workers)\n
+    Return: max_depth, max_time_sec (None: configured limit)"""
+
+    if wait_sec > QUEUE_DEADLINE_SEC:
+        return 1, MIN_SEARCH_TIME_SEC
+
+    if queued == 0:
+        return None, None
+
+    load = (queued + MAX_WORKERS) / MAX_WORKERS
+    return None, max(timeout_sec / load, MIN_SEARCH_TIME_SEC)
+
+
+def __listen_for_progress(progress_queue):
+    """Background thread: Move progress messages of the workers into the jobs"""
+
+    while True:
+        try:
+            job_id, depth, best_move, score = progress_queue.get()
+        except (EOFError, OSError):
+            return # Manager was shut down
+
+        with __jobs_changed:
+            job = __jobs.get(job_id)
+            if job is None or job.is_finished():
+                continue
+
+            if depth == 0:
+                job.status = STATUS_RUNNING
+            else:
+                job.iterations.append({
+                    'depth': depth,
+                    'cur_mask': best_move[0],
+                    'dst_mask': best_move[1],
+                    'score': score,
+                })
+            job.version += 1
+            __jobs_changed.notify_all()
+
+
+def __finish_job(job: BotJob, future):
+    """Store result or error of a finished search and start the next waiting job"""
+
+    global __running_jobs
+
+    cancellation.unregister(job.game_id, job.cancel_token)
+
+    if future.cancelled() or isinstance(future.exception(), SearchCancelled):
+        status = STATUS_CANCELLED
+    elif future.exception() is not None:
+        status = STATUS_FAILED
+        job.error = str(future.exception())
+    else:
+        status = STATUS_DONE
+        job.result = future.result()
+        if job.on_done is not None:
+            try:
+                job.on_done(job)
+            except Exception as e:
+                status = STATUS_FAILED
+                job.error = str(e)
+
+    __record_metrics(job, status)
+
+    with __jobs_changed:
+        __set_finished(job, status)
+        __running_jobs -= 1
+        if __executor is not None:
+            __dispatch_jobs()
+
+
+def __record_metrics(job: BotJob, status: str):
+    """Add a finished search to the metrics (numbers measured in the worker come with the result)"""
+
+    metrics.BOT_SEARCHES.inc(status=status)
+    if job.dispatched_time is not None:
+        metrics.BOT_QUEUE_WAIT.observe(job.wait_sec())
+    if job.is_degraded():
+        metrics.BOT_DEGRADED.inc()
+
+    if job.result is None:
+        return
+
+    stats = job.result['stats']
+    metrics.BOT_SEARCH_DURATION.observe(stats['elapsed_sec'])
+    metrics.BOT_NODES.inc(stats['nodes'])
+    metrics.BOT_NODES_PER_SEARCH.observe(stats['nodes'])
+    metrics.BOT_QUIESCENCE_NODES.inc(stats['quiescence_nodes'])
+    metrics.BOT_CUTOFFS.inc(stats['cutoffs'])
+    metrics.BOT_FIRST_MOVE_CUTOFFS.inc(stats['first_move_cutoffs'])
+    if stats['nodes']:
+        metrics.BOT_NODES_PER_SEC.observe(stats['nodes_per_sec'])
+    if stats['depth']:
+        metrics.BOT_DEPTH.observe(stats['depth'])
+    if stats['timeout_reason'] == cancellation.REASON_TIMEOUT:
+        metrics.BOT_TIMEOUTS.inc()
+    if bot.USE_POSITION_CACHE:
+        metrics.POSITION_CACHE_LOOKUPS.inc(result='hit' if stats['cache_hit'] else 'miss')
+
+
+def __set_finished(job: BotJob, status: str):
+    """Mark a job as finished and wake up its followers (lock must be held)"""
+
+    job.status = status
+    job.finished_time = time.time()
+    job.version += 1
+    __jobs_changed.notify_all()
+
+
+def __forget_old_jobs():
+    """Drop finished jobs after the retention time"""
+
+    now = time.time()
+    with __jobs_changed:
+        for job_id, job in list(__jobs.items()):
+            if job.is_finished() and now - job.finished_time > JOB_RETENTION_SEC:
+                del __jobs[job_id]
+
+
+def __search_job(
+        job_id: str,
+        board_size_x: int,
+        board_size_y: int,
+        bitboard: tuple[int, int, int, int],
+        moving_white: bool,
+        remaining_time_sec: float,
+        increment_sec: float,
+        max_depth: int,
+        max_time_sec: float,
+        profile_mode: str,
+        cancel_token: CancellationToken,
+        progress_queue
+    ) -> dict:
+    """Worker process: Search the bot move and apply it to the board"""
+
+    cancel_token.raise_if_cancelled()
+    gameboard.use_board_size(board_size_x, board_size_y)
+    progress_queue.put((job_id, 0, None, None)) # Job started
+
+    def on_iteration(depth, best_move, score):
+        progress_queue.put((job_id, depth, best_move, score))
+
+    if gl.DEBUG_ANALYZE_MINIMAX_TIME and profile_mode is None:
+        profile_mode = profiling.MODE_CPROFILE
+
+    (cur_mask, dst_mask, stats), profile_path = profiling.run_profiled(
+        profile_mode,
+        job_id,
+        bot.find_move_for_bot,
+        *bitboard,
+        moving_white,
+        remaining_time_sec=remaining_time_sec,
+        increment_sec=increment_sec,
+        cancel_token=cancel_token,
+        on_iteration=on_iteration,
+        max_depth=max_depth,
+        max_time_sec=max_time_sec,
+        return_stats=True
+    )
+
+    if gl.DEBUG_ANALYZE_MINIMAX_TIME and profile_mode == profiling.MODE_CPROFILE:
+        print(f'\ncProfile:\n\n{profiling.format_pstats(profile_path)}')
+
+    bitboard_new, (white_wins, black_wins) = move_mgr.move(
+        *bitboard,
+        cur_mask,
+        dst_mask,
+        moving_white
+    )
+
+    return {
+        'cur_mask': cur_mask,
+        'dst_mask': dst_mask,
+        'bitboard': bitboard_new,
+        'white_wins': white_wins,
+        'black_wins': black_wins,
+        'stats': stats.to_dict(),
+        'profile_path': profile_path,
+    }
@@ -0,0 +1,103 @@
+import threading, time
+
+REASON_TIMEOUT = 'timeout'
+REASON_CANCELLED = 'cancelled'
+REASON_RESTART = 'restart'
+REASON_DISCONNECT = 'disconnect'
+REASON_SHUTDOWN = 'shutdown'
+
+
+class SearchCancelled(Exception):
+    """Raised inside the bot search when its cancellation token was triggered"""
+
+
+class CancellationToken:
+    """Cooperative cancellation of a bot search.\n
+    The search polls `is_cancelled()` in its node loop and unwinds with `SearchCancelled`.
+    A token is cancelled explicitly by `cancel()` or implicitly once its deadline passed."""
+
+    def __init__(self, event=None, poll_interval: int = 1):
+        self._event = event if event is not None else threading.Event()
+        self.deadline = None
+        self.reason = None
+        self.poll_interval = poll_interval # Only look at the event every X calls (e.g. for events of other processes)
+        self._polls = 0
+
+    def cancel(self, reason: str = REASON_CANCELLED):
+        if self.reason is None:
+            self.reason = reason
+        self._event.set()
+
+    def set_deadline(self, deadline: float):
+        """Cancel the token at the given time (as returned by time.time())"""
+        self.deadline = deadline
+
+    def is_cancelled(self) -> bool:
+        if self.reason is not None:
+            return True
+
+        if self.deadline is not None and time.time() > self.deadline:
+            self.reason = REASON_TIMEOUT
+            return True
+
+        poll = self._polls == 0
+        self._polls = (self._polls + 1) % self.poll_interval
+        if poll and self._event.is_set():
+            self.reason = REASON_CANCELLED # Cancelled by another process
+            return True
+        return False
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled():
+            raise SearchCancelled(self.reason)
+
+
+# --------------------------------------------------------------------------
+# Registry of running searches (per game)
+# --------------------------------------------------------------------------
+
+__active_tokens: dict[str, set[CancellationToken]] = {}
+__lock = threading.Lock()
+
+
+def register(game_id: str, token: CancellationToken = None) -> CancellationToken:
+    """Register a search of a game, so it can be cancelled by game id"""
+
+    token = token if token is not None else CancellationToken()
+    with __lock:
+        __active_tokens.setdefault(game_id, set()).add(token)
+    return token
+
+
+def unregister(game_id: str, token: CancellationToken):
+    """Remove a finished search from the registry"""
+
+    with __lock:
+        tokens = __active_tokens.get(game_id)
+        if tokens is None:
+            return
+        tokens.discard(token)
+        if not tokens:
+            del __active_tokens[game_id]
+
+
+def cancel_game(game_id: str, reason: str = REASON_CANCELLED) -> int:
+    """Cancel all running searches of a game\n
+    Return: number of cancelled searches"""
+
+    with __lock:
+        tokens = list(__active_tokens.get(game_id, ()))
+    for token in tokens:
+        token.cancel(reason)
+    return len(tokens)
+
+
+def cancel_all(reason: str = REASON_SHUTDOWN) -> int:
+    """Cancel all running searches, e.g. on server shutdown\n
+    Return: number of cancelled searches"""
+
+    with __lock:
+        tokens = [token for tokens in __active_tokens.values() for token in tokens]
+    for token in tokens:
+        token.cancel(reason)
+    return len(tokens)
@@ -0,0 +1,356 @@
+from . import global_variables as gl
+
+from collections import OrderedDict
+from types import SimpleNamespace
+import threading
+
+ENABLED = gl.CONFIG["codegen_enabled"] # Use generated rule functions per board geometry
+MAX_ENGINES = gl.CONFIG["codegen_max_engines"] # Compiled geometries kept (least recently used are dropped)
+
+# --------------------------------------------------------------------------
+# Rule functions specialised to one board geometry
+#
+# The generic rules read the geometry from `gl` and move single squares with the
+# cached shift functions of `gameboard`. For a given size, `generate_source` writes
+# the hot functions again with column/row masks and shifts as literals, the four
+# directions unrolled and per-square tables (rays, neighbours) instead of shifts.
+# The source is compiled once per geometry (see `get_engine`) and activated by
+# `gameboard.use_board_size`. Results (and the order of moves) are the same as
+# of the generic functions; `benchmark.py perft` compares both.
+# --------------------------------------------------------------------------
+
+DIRECTIONS = ('right', 'left', 'down', 'up') # Order of the rules (captures, neighbours)
+MOVE_DIRECTIONS = ('left', 'right', 'up', 'down') # Order of the move generation
+OPPOSITE = {'right': 'left', 'left': 'right', 'down': 'up', 'up': 'down'}
+
+__engines: OrderedDict[tuple[int, int], SimpleNamespace] = OrderedDict()
+__lock = threading.Lock()
+
+
+def get_engine(board_size_x: int, board_size_y: int) -> SimpleNamespace:
+    """Generated functions of a board geometry (compiled on first use):
+    `find_legal_moves_on_bitboard`, `apply_move`, `find_captures_after_move`, `find_capture_squares`,
+    `estimate_mobility`\n
+    Return: None for boards above the supported size (the per-square tables grow with the area squared)"""
+
+    if max(board_size_x, board_size_y) > gl.MAX_BOARD_SIZE:
+        return None
+
+    key = (board_size_x, board_size_y)
+    with __lock:
+        engine = __engines.get(key)
+        if engine is not None:
+            __engines.move_to_end(key)
+        else:
+            namespace = __build_tables(board_size_x, board_size_y)
+            code = compile(
+                generate_source(board_size_x, board_size_y),
+                f'<rules {board_size_x}x{board_size_y}>',
+                'exec'
+            )
+            exec(code, namespace)
+            engine = SimpleNamespace(**{
+                name: namespace[name] for name in (
+                    'find_legal_moves_on_bitboard', 'apply_move',
+                    'find_captures_after_move', 'find_capture_squares', 'estimate_mobility',
+                )
+            })
+            __engines[key] = engine
+            while len(__engines) > MAX_ENGINES:
+                __engines.popitem(last=False)
+        return engine
+
+
+def generate_source(board_size_x: int, board_size_y: int) -> str:
+    """Python source of the rule functions for one board geometry"""
+
+    masks = __get_masks(board_size_x, board_size_y)
+
+    def shift(direction: str, var: str) -> str:
+        """Expression: like `gameboard.shift_<direction>(var)`"""
+        edge, operator, amount = {
+            'right': (masks['right_col'], '<<', 1),
+            'left': (masks['left_col'], '>>', 1),
+            'down': (masks['bottom_row'], '<<', board_size_x),
+            'up': (masks['top_row'], '>>', board_size_x),
+        }[direction]
+        return f'(0 if {var} & {edge:#x} else {var} {operator} {amount})'
+
+    def king_trapped(king: str, all_pieces: str) -> str:
+        """Expression: like `rules.__is_king_trapped(king, all_pieces)`"""
+        return 'not (' + ' or '.join(
+            f'((neighbour := {shift(direction, king)}) and not {all_pieces} & neighbour)'
+            for direction in DIRECTIONS
+        ) + ')'
+
+    def fill(direction: str, steps: list[int]) -> list[str]:
+        """Statements: Kogge-Stone fill of `gen` through `propagator` (like `gameboard.reachable_*`)"""
+        operator = '<<' if direction in ('right', 'down') else '>>'
+        lines = []
+        for i, amount in enumerate(steps):
+            lines.append(f'gen |= propagator & (gen {operator} {amount})')
+            if i < len(steps) - 1:
+                lines.append(f'propagator &= propagator {operator} {amount}')
+        return lines
+
+    def kogge_stone_steps(line_length: int, unit: int) -> list[int]:
+        steps = []
+        step = 1
+        while step < line_length:
+            steps.append(step * unit)
+            step <<= 1
+        return steps
+
+    source = [f'# Generated for a {board_size_x}x{board_size_y} board (see python/codegen.py)', '']
+
+    # --- Captures -------------------------------------------------------
+    source += [
+        'def find_captures_after_move(white_pieces, white_kings, black_pieces, black_kings, dst_mask,',
+        '                             _neighbours=NEIGHBOURS, ' + ', '.join(
+            f'_line_{d}=LINES_{d.upper()}, _neighbour_{d}=NEIGHBOUR_{d.upper()}' for d in DIRECTIONS) + '):',
+        '    all_pieces = white_pieces | white_kings | black_pieces | black_kings',
+        '    if (white_pieces | white_kings) & dst_mask:',
+        '        my_all, my_kings = white_pieces | white_kings, white_kings',
+        '        opponent_pieces, opponent_kings = black_pieces, black_kings',
+        '    else:',
+        '        my_all, my_kings = black_pieces | black_kings, black_kings',
+        '        opponent_pieces, opponent_kings = white_pieces, white_kings',
+        '    opponent_all = opponent_pieces | opponent_kings',
+        '    dst_index = dst_mask.bit_length() - 1',
+        '    captured_mask = 0',
+        '',
+        '    # Opponent pieces trapped in a line',
+    ]
+    for direction in DIRECTIONS:
+        source += [
+            f'    line = _line_{direction}[dst_index]',
+            f'    if line and not (opponent_all & line[0] and opponent_all & _neighbour_{OPPOSITE[direction]}[dst_index]):',
+            '        buffer = 0',
+            '        for forward_mask in line:',
+            '            if not all_pieces & forward_mask:',
+            '                break',
+            '            if opponent_pieces & forward_mask:',
+            '                buffer |= forward_mask',
+            '            elif my_all & forward_mask:',
+            '                captured_mask |= buffer',
+            '                break',
+        ]
+    source += [
+        '',
+        '    # Opponent king',
+        f'    if {king_trapped("opponent_kings", "all_pieces")}:',
+        '        captured_mask |= opponent_kings',
+        '',
+        '    # Opponent groups',
+    ]
+    for direction in DIRECTIONS:
+        source += [
+            f'    neighbour = _neighbour_{direction}[dst_index]',
+            '    if opponent_all & neighbour:',
+            '        captured_mask |= _trapped_group(opponent_all, all_pieces, neighbour, _neighbours)',
+        ]
+    source += [
+        '',
+        '    # My own king',
+        '    all_pieces ^= captured_mask',
+        f'    if {king_trapped("my_kings", "all_pieces")}:',
+        '        captured_mask |= my_kings',
+        '    return captured_mask',
+        '',
+        '',
+        'def find_capture_squares(white_pieces, white_kings, black_pieces, black_kings, moving_white):',
+        '    all_pieces = white_pieces | white_kings | black_pieces | black_kings',
+        '    if white_kings & (white_kings - 1) or black_kings & (black_kings - 1):',
+        f'        return {masks["board"]:#x}',
+        f'    if {king_trapped("white_kings", "all_pieces")} or {king_trapped("black_kings", "all_pieces")}:',
+        f'        return {masks["board"]:#x}',
+        '    if moving_white:',
+        '        mask = black_pieces | black_kings | white_kings',
+        '    else:',
+        '        mask = white_pieces | white_kings | black_kings',
+        f'    return (((mask & {masks["board"] & ~masks["right_col"]:#x}) << 1) | ((mask & {masks["board"] & ~masks["left_col"]:#x}) >> 1) |',
+        f'            ((mask << {board_size_x}) & {masks["board"]:#x}) | (mask >> {board_size_x}))',
+        '',
+        '',
+        'def _trapped_group(opponent_mask, all_pieces, to_explore, neighbours):',
+        '    visited = 0',
+        '    while to_explore:',
+        '        current = to_explore & -to_explore',
+        '        to_explore ^= current',
+        '        if visited & current:',
+        '            continue',
+        '        visited |= current',
+        '        for neighbour in neighbours[current.bit_length() - 1]:',
+        '            if opponent_mask & neighbour and not visited & neighbour:',
+        '                to_explore |= neighbour',
+        '            elif not all_pieces & neighbour:',
+        '                return 0',
+        '    return visited',
+        '',
+        '',
+    ]
+
+    # --- Apply move -----------------------------------------------------
+    source += [
+        'def apply_move(white_pieces, white_kings, black_pieces, black_kings, cur_mask, dst_mask):',
+        '    if white_kings & cur_mask:',
+        '        white_kings = (white_kings ^ cur_mask) | dst_mask',
+        '    elif white_pieces & cur_mask:',
+        '        white_pieces = (white_pieces ^ cur_mask) | dst_mask',
+        '    elif black_kings & cur_mask:',
+        '        black_kings = (black_kings ^ cur_mask) | dst_mask',
+        '    elif black_pieces & cur_mask:',
+        '        black_pieces = (black_pieces ^ cur_mask) | dst_mask',
+        '    captured_mask = find_captures_after_move(white_pieces, white_kings, black_pieces, black_kings, dst_mask)',
+        '    remaining_mask = ~captured_mask',
+        '    return (white_pieces & remaining_mask, white_kings & remaining_mask,',
+        '            black_pieces & remaining_mask, black_kings & remaining_mask, captured_mask)',
+        '',
+        '',
+    ]
+
+    # --- Move generation ------------------------------------------------
+    source += [
+        'def find_legal_moves_on_bitboard(white_pieces, white_kings, black_pieces, black_kings, moving_white,',
+        '                                 ' + ', '.join(f'_rays_{d}=RAYS_{d.upper()}' for d in MOVE_DIRECTIONS) + '):',
+        '    all_pieces = white_pieces | white_kings | black_pieces | black_kings',
+        '    if moving_white:',
+        '        my_kings, opponent_all = white_kings, black_pieces | black_kings',
+        '        my_all = white_pieces | white_kings',
+        '    else:',
+        '        my_kings, opponent_all = black_kings, white_pieces | white_kings',
+        '        my_all = black_pieces | black_kings',
+        '',
+        '    legal_moves = []',
+        '    append = legal_moves.append',
+        '    while my_all:',
+        '        cur_mask = my_all & -my_all',
+        '        my_all ^= cur_mask',
+        '        cur_index = cur_mask.bit_length() - 1',
+        '',
+        '        if my_kings & cur_mask:',
+        '            # King: slides, or jumps over a line of pieces if this captures',
+    ]
+    for direction in MOVE_DIRECTIONS:
+        source += [
+            f'            ray = _rays_{direction}[cur_index]',
+            '            if ray and all_pieces & ray[0][0]:',
+            '                for step_mask, _ in ray:',
+            '                    if not all_pieces & step_mask:',
+            '                        captured_mask = apply_move(white_pieces, white_kings, black_pieces, black_kings, cur_mask, step_mask)[4]',
+            '                        if captured_mask & opponent_all and not captured_mask & my_kings:',
+            '                            append((cur_mask, step_mask))',
+            '                        break',
+            '            else:',
+            '                for step_mask, _ in ray:',
+            '                    if all_pieces & step_mask:',
+            '                        break',
+            '                    append((cur_mask, step_mask))',
+        ]
+    source += [
+        '        else:',
+        '            # Piece: slides, unless this captures an own king next to the destination',
+    ]
+    for direction in MOVE_DIRECTIONS:
+        source += [
+            f'            for step_mask, neighbours_mask in _rays_{direction}[cur_index]:',
+            '                if all_pieces & step_mask:',
+            '                    break',
+            '                if not neighbours_mask & my_kings or not apply_move(',
+            '                        white_pieces, white_kings, black_pieces, black_kings, cur_mask, step_mask)[4] & my_kings:',
+            '                    append((cur_mask, step_mask))',
+        ]
+    source += [
+        '    return legal_moves',
+        '',
+        '',
+    ]
+
+    # --- Evaluation -----------------------------------------------------
+    source += [
+        'def estimate_mobility(white_pieces, white_kings, black_pieces, black_kings, mycolor_is_white):',
+        '    all_pieces = white_pieces | white_kings | black_pieces | black_kings',
+        '    my_pieces = white_pieces | white_kings if mycolor_is_white else black_pieces | black_kings',
+        f'    empty = ~all_pieces & {masks["board"]:#x}',
+        '    mobility = 0',
+    ]
+    for direction in ('right', 'left', 'down', 'up'):
+        if direction == 'right':
+            pro, steps, last_shift = f'empty & {masks["board"] & ~masks["left_col"]:#x}', kogge_stone_steps(board_size_x, 1), '<< 1'
+        elif direction == 'left':
+            pro, steps, last_shift = f'empty & {masks["board"] & ~masks["right_col"]:#x}', kogge_stone_steps(board_size_x, 1), '>> 1'
+        elif direction == 'down':
+            pro, steps, last_shift = 'empty', kogge_stone_steps(board_size_y, board_size_x), f'<< {board_size_x}'
+        else:
+            pro, steps, last_shift = 'empty', kogge_stone_steps(board_size_y, board_size_x), f'>> {board_size_x}'
+        source += [
+            f'    # {direction}',
+            f'    propagator = pro = {pro}',
+            '    gen = my_pieces',
+        ]
+        source += ['    ' + line for line in fill(direction, steps)]
+        source += [f'    mobility += ((gen {last_shift}) & pro).bit_count()']
+    source += [
+        '    return mobility',
+        '',
+    ]
+
+    return '\n'.join(source)
+
+
+def __get_masks(board_size_x: int, board_size_y: int) -> dict[str, int]:
+    """Helper function: Geometry masks (like `gl.update_global_variables`)"""
+
+    left_col = sum(1 << (y * board_size_x) for y in range(board_size_y))
+    top_row = (1 << board_size_x) - 1
+    return {
+        'board': (1 << (board_size_x * board_size_y)) - 1,
+        'left_col': left_col,
+        'right_col': left_col << (board_size_x - 1),
+        'top_row': top_row,
+        'bottom_row': top_row << (board_size_x * (board_size_y - 1)),
+    }
+
+
+def __build_tables(board_size_x: int, board_size_y: int) -> dict:
+    """Helper function: Per-square tables of the generated functions\n
+    - NEIGHBOUR_<DIR>[index]: neighbour square mask in the direction (0: off board)
+    - NEIGHBOURS[index]: all neighbour square masks (right, left, down, up)
+    - LINES_<DIR>[index]: squares from the neighbour to the edge in the direction
+    - RAYS_<DIR>[index]: as LINES, each with the mask of its own neighbours"""
+
+    number_of_squares = board_size_x * board_size_y
+    steps = {'right': (1, 0), 'left': (-1, 0), 'down': (0, 1), 'up': (0, -1)}
+
+    def neighbour(index: int, direction: str) -> int:
+        y, x = divmod(index, board_size_x)
+        dx, dy = steps[direction]
+        x, y = x + dx, y + dy
+        return 1 << (y * board_size_x + x) if 0 <= x < board_size_x and 0 <= y < board_size_y else 0
+
+    tables = {}
+    neighbours_mask = []
+    for index in range(number_of_squares):
+        neighbours_mask.append(sum(neighbour(index, direction) for direction in DIRECTIONS))
+    tables['NEIGHBOURS'] = tuple(
+        tuple(mask for mask in (neighbour(index, direction) for direction in DIRECTIONS) if mask)
+        for index in range(number_of_squares)
+    )
+
+    for direction in DIRECTIONS:
+        tables[f'NEIGHBOUR_{direction.upper()}'] = tuple(
+            neighbour(index, direction) for index in range(number_of_squares)
+        )
+        lines = []
+        for index in range(number_of_squares):
+            line = []
+            mask = neighbour(index, direction)
+            while mask:
+                line.append(mask)
+                mask = neighbour(mask.bit_length() - 1, direction)
+            lines.append(tuple(line))
+        tables[f'LINES_{direction.upper()}'] = tuple(lines)
+        tables[f'RAYS_{direction.upper()}'] = tuple(
+            tuple((mask, neighbours_mask[mask.bit_length() - 1]) for mask in line) for line in lines
+        )
+    return tables
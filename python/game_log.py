@@ -0,0 +1,236 @@
+from . import global_variables as gl
+from . import gameboard
+from . import move_manager as move_mgr
+
+from array import array
+from dataclasses import dataclass
+import atexit, mmap, os, struct, sys, threading
+
+LOG_PATH = gl.CONFIG["game_log_path"] # Append-only file of finished games ("": not recorded)
+FLUSH_INTERVAL_SEC = gl.CONFIG["game_log_flush_interval_sec"] # Max. delay until a recorded game is written
+FLUSH_BYTES = 1 << 16 # Write earlier if this many bytes are queued
+
+if LOG_PATH and not os.path.isabs(LOG_PATH):
+    LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), LOG_PATH)
+
+
+# --------------------------------------------------------------------------
+# Binary log of finished games
+#
+# Each game is a header followed by its moves:
+#
+#   header: magic b'LG', version, board_size_x, board_size_y, flags, winner,
+#           game_time_seconds (float32, 0: no clock), number of moves (uint32),
+#           config hash (8 bytes, `gl.SEARCH_CONFIG_HASH` of the recording process)
+#   moves:  uint16 square indices (y * X + x), from/to per move
+#
+# All values are little-endian. A flush writes whole games in a single append,
+# so several processes can share one file.
+# --------------------------------------------------------------------------
+
+MAGIC = b'LG'
+VERSION = 2
+HEADER = struct.Struct('<2sBBBBBfI8s')
+
+FLAG_USER_IS_WHITE = 1
+FLAG_PLAY_AGAINST_BOT = 2
+
+WINNER_NONE = 0
+WINNER_WHITE = 1
+WINNER_BLACK = 2
+
+
+@dataclass
+class GameRecord:
+    """A game read from the log (see `read_games`)"""
+    board_size_x: int
+    board_size_y: int
+    user_is_white: bool
+    play_against_bot: bool
+    game_time_seconds: float
+    winner: int # WINNER_NONE, WINNER_WHITE or WINNER_BLACK
+    config_hash: str # Search settings of the recording process (see `gl.SEARCH_CONFIG_HASH`)
+    moves: memoryview # Square indices [from, to, from, to, ...] (view into the mapped file)
+
+    def number_of_moves(self) -> int:
+        return len(self.moves) // 2
+
+
+__buffer = bytearray()
+__lock = threading.Lock()
+__flush_requested = threading.Event()
+__writer = None
+
+
+def record_game(game) -> bool:
+    """Queue a finished game (`game_store.GameState`) for the log. The file is written in the background.\n
+    Return: True if the game is recorded"""
+
+    if not LOG_PATH:
+        return False
+
+    record = __pack_game(
+        game.board_size_x,
+        game.board_size_y,
+        game.user_is_white,
+        game.play_against_bot,
+        game.game_time_seconds,
+        WINNER_WHITE if game.white_wins else WINNER_BLACK if game.black_wins else WINNER_NONE,
+        game.history
+    )
+
+    with __lock:
+        __buffer.extend(record)
+        __start_writer()
+        if len(__buffer) >= FLUSH_BYTES:
+            __flush_requested.set()
+    return True
+
+
+def flush():
+    """Write all queued games to the log now"""
+
+    with __lock:
+        data = bytes(__buffer)
+        __buffer.clear()
+    if not data:
+        return
+
+    # A single append per flush: games of several processes do not interleave
+    fd = os.open(LOG_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def read_games(path: str = LOG_PATH):
+    """Generator: Yield all games of a log as `GameRecord`.\n
+    The file is memory mapped; the moves of a record are only valid until the next record is read
+    (copy them with `array('H', record.moves)` to keep them). An incomplete last game is ignored."""
+
+    if os.path.getsize(path) == 0:
+        return
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        data = memoryview(mapped)
+        offset = 0
+        try:
+            while offset + HEADER.size <= len(data):
+                (magic, version,
+                 board_size_x, board_size_y,
+                 flags, winner,
+                 game_time_seconds, number_of_moves,
+                 config_hash) = HEADER.unpack_from(data, offset)
+                if magic != MAGIC:
+                    raise ValueError(f'{path} is no game log (or damaged at byte {offset})')
+                if version != VERSION:
+                    raise ValueError(f'{path} has game log version {version}, {VERSION} is supported')
+
+                start = offset + HEADER.size
+                end = start + 4 * number_of_moves
+                if end > len(data):
+                    break # Written while interrupted
+
+                view = data[start:end].cast('H')
+                moves = view if sys.byteorder == 'little' else memoryview(__swap_bytes(view))
+
+                try:
+                    yield GameRecord(
+                        board_size_x=board_size_x,
+                        board_size_y=board_size_y,
+                        user_is_white=bool(flags & FLAG_USER_IS_WHITE),
+                        play_against_bot=bool(flags & FLAG_PLAY_AGAINST_BOT),
+                        game_time_seconds=game_time_seconds or None,
+                        winner=winner,
+                        config_hash=config_hash.hex(),
+                        moves=moves
+                    )
+                finally:
+                    moves.release() # The file can only be unmapped without views into it
+                    view.release()
+                offset = end
+        finally:
+            data.release()
+
+
+def replay_game(record: GameRecord):
+    """Generator: Replay a recorded game from its initial position.\n
+    Switches the board geometry of the process (see `gameboard.use_board_size`),
+    i.e. meant for offline tools, not for the web server.\n
+    Yield: (white_pieces, white_kings, black_pieces, black_kings), moving_white, (cur_mask, dst_mask)
+    before every move, and the final position with move None"""
+
+    bitboard = gameboard.create_bitboard_new_game(
+        board_size_x=record.board_size_x,
+        board_size_y=record.board_size_y,
+        user_is_white=record.user_is_white
+    )
+    moving_white = True
+    moves = record.moves
+    apply_move = move_mgr.apply_move
+
+    for i in range(0, len(moves), 2):
+        move = (1 << moves[i], 1 << moves[i + 1])
+        yield bitboard, moving_white, move
+        bitboard = apply_move(*bitboard, *move)[:4]
+        moving_white = not moving_white
+
+    yield bitboard, moving_white, None
+
+
+def __pack_game(
+        board_size_x: int,
+        board_size_y: int,
+        user_is_white: bool,
+        play_against_bot: bool,
+        game_time_seconds: float,
+        winner: int,
+        history: list[tuple[int, int]]
+    ) -> bytes:
+    """Helper function: Binary record of a game (header + moves)"""
+
+    moves = array('H')
+    for cur_mask, dst_mask in history:
+        moves.append(cur_mask.bit_length() - 1)
+        moves.append(dst_mask.bit_length() - 1)
+    if sys.byteorder != 'little':
+        moves.byteswap()
+
+    flags = (FLAG_USER_IS_WHITE if user_is_white else 0) | (FLAG_PLAY_AGAINST_BOT if play_against_bot else 0)
+    header = HEADER.pack(
+        MAGIC, VERSION,
+        board_size_x, board_size_y,
+        flags, winner,
+        game_time_seconds or 0.0, len(history),
+        bytes.fromhex(gl.SEARCH_CONFIG_HASH)
+    )
+    return header + moves.tobytes()
+
+
+def __swap_bytes(moves: memoryview) -> array:
+    """Helper function: Moves of the log in native byte order (big-endian machines)"""
+    native = array('H', moves)
+    native.byteswap()
+    return native
+
+
+def __start_writer():
+    """Start the background thread that flushes the queued games (lock must be held)"""
+
+    global __writer
+
+    if __writer is None:
+        __writer = threading.Thread(target=__write_periodically, daemon=True)
+        __writer.start()
+        atexit.register(flush)
+
+
+def __write_periodically():
+    while True:
+        __flush_requested.wait(FLUSH_INTERVAL_SEC)
+        __flush_requested.clear()
+        try:
+            flush()
+        except OSError as e:
+            print(f'Game log: writing {LOG_PATH} failed: {e}')
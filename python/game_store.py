@@ -0,0 +1,181 @@
+from . import global_variables as gl
+from . import gameboard
+from . import game_log
+from . import move_manager as move_mgr
+from . import rules
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import threading, time, uuid
+
+MAX_GAMES = gl.CONFIG["game_store_max_games"] # Least recently used games are dropped beyond this number
+IDLE_TIMEOUT_SEC = gl.CONFIG["game_store_idle_timeout_sec"] # Games without request for X seconds are dropped
+
+
+@dataclass
+class GameState:
+    """Authoritative state of a running game"""
+    game_id: str
+    board_size_x: int
+    board_size_y: int
+    white_pieces: int
+    white_kings: int
+    black_pieces: int
+    black_kings: int
+    white_time_sec: float # Remaining clock of white
+    black_time_sec: float # Remaining clock of black
+    user_is_white: bool = True # Settings of the game (chosen at its start)
+    play_against_bot: bool = True
+    game_time_seconds: float = None
+    moving_white: bool = True
+    white_wins: bool = False
+    black_wins: bool = False
+    history: list = field(default_factory=list) # Played moves [(cur_mask, dst_mask), ...]
+    turn_start_time: float = None # Clock of the side to move runs since (None: not started)
+    last_access_time: float = field(default_factory=time.time)
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+    _legal_moves: dict = field(default=None, repr=False)
+
+    def bitboard(self) -> tuple[int, int, int, int]:
+        return self.white_pieces, self.white_kings, self.black_pieces, self.black_kings
+
+    def is_finished(self) -> bool:
+        return self.white_wins or self.black_wins
+
+    def legal_moves(self) -> dict[int, list[int]]:
+        """All legal moves of the side to move (computed once per turn)\n
+        Return: {cur_mask: [dst_mask, ...], ...}"""
+
+        if self._legal_moves is None:
+            legal_moves = {}
+            with gameboard.board_geometry(self.board_size_x, self.board_size_y):
+                for cur_mask, dst_mask in move_mgr.find_legal_moves_on_bitboard(
+                        *self.bitboard(), self.moving_white):
+                    legal_moves.setdefault(cur_mask, []).append(dst_mask)
+            self._legal_moves = legal_moves
+
+        return self._legal_moves
+
+    def play_move(self, cur_mask: int, dst_mask: int) -> int:
+        """Play a move of the side to move, checked against the legal moves of the turn\n
+        Return: captured_mask"""
+
+        if self.is_finished():
+            raise ValueError('Move Error: The game is already finished.')
+
+        if dst_mask not in self.legal_moves().get(cur_mask, ()):
+            raise ValueError('Move Error: Ilegal move.')
+
+        with gameboard.board_geometry(self.board_size_x, self.board_size_y):
+            (self.white_pieces, self.white_kings,
+             self.black_pieces, self.black_kings,
+             captured_mask) = move_mgr.apply_move(*self.bitboard(), cur_mask, dst_mask)
+
+            self.white_wins, self.black_wins = rules.check_for_winner(*self.bitboard())
+
+        # Stop clock of the mover
+        now = time.time()
+        if self.turn_start_time is not None:
+            if self.moving_white:
+                self.white_time_sec = max(self.white_time_sec - (now - self.turn_start_time), 0.0)
+            else:
+                self.black_time_sec = max(self.black_time_sec - (now - self.turn_start_time), 0.0)
+        self.turn_start_time = now
+
+        self.history.append((cur_mask, dst_mask))
+        self.moving_white = not self.moving_white
+        self._legal_moves = None
+
+        if self.is_finished():
+            game_log.record_game(self)
+
+        return captured_mask
+
+    def is_bot_turn(self) -> bool:
+        """Check if the side to move is played by the bot"""
+        return self.play_against_bot and self.moving_white != self.user_is_white
+
+    def remaining_time_sec(self, white: bool) -> float:
+        """Remaining clock of a color (incl. the running turn)"""
+
+        remaining = self.white_time_sec if white else self.black_time_sec
+        if self.turn_start_time is not None and white == self.moving_white:
+            remaining -= time.time() - self.turn_start_time
+        return max(remaining, 0.0)
+
+
+__games: OrderedDict[str, GameState] = OrderedDict()
+__lock = threading.Lock()
+
+
+def create_game(
+        board_size_x: int,
+        board_size_y: int,
+        user_is_white: bool,
+        game_time_seconds: float,
+        play_against_bot: bool = True
+    ) -> GameState:
+    """Create a new game at its initial state and keep it in the store"""
+
+    with gameboard.board_geometry(board_size_x, board_size_y):
+        (white_pieces, white_kings,
+         black_pieces, black_kings) = gameboard.create_bitboard_new_game(
+            board_size_x=board_size_x,
+            board_size_y=board_size_y,
+            user_is_white=user_is_white
+        )
+
+    game = GameState(
+        game_id=uuid.uuid4().hex,
+        board_size_x=board_size_x,
+        board_size_y=board_size_y,
+        white_pieces=white_pieces,
+        white_kings=white_kings,
+        black_pieces=black_pieces,
+        black_kings=black_kings,
+        white_time_sec=game_time_seconds,
+        black_time_sec=game_time_seconds,
+        user_is_white=user_is_white,
+        play_against_bot=play_against_bot,
+        game_time_seconds=game_time_seconds
+    )
+
+    with __lock:
+        __games[game.game_id] = game
+        __evict_games()
+
+    return game
+
+
+def get_game(game_id: str) -> GameState:
+    """Return the game with the given id (None if unknown or evicted)"""
+
+    with __lock:
+        __evict_games()
+        game = __games.get(game_id)
+        if game is not None:
+            game.last_access_time = time.time()
+            __games.move_to_end(game_id)
+        return game
+
+
+def count_games() -> int:
+    """Number of games in the store"""
+    with __lock:
+        return len(__games)
+
+
+def remove_game(game_id: str):
+    with __lock:
+        __games.pop(game_id, None)
+
+
+def __evict_games():
+    """Drop idle games and the least recently used games above the limit (lock must be held)"""
+
+    now = time.time()
+    while __games:
+        game_id, game = next(iter(__games.items()))
+        if len(__games) <= MAX_GAMES and now - game.last_access_time <= IDLE_TIMEOUT_SEC:
+            break
+        del __games[game_id]
@@ -1,8 +1,11 @@
 from . import global_variables as gl
+from . import codegen
 from . import rules
 from . import move_manager as move_mgr
 
+from contextlib import contextmanager
 from functools import cache
+import threading
 
 
 def create_bitboard_new_game(
@@ -17,11 +20,7 @@ def create_bitboard_new_game(
     black_pieces = 0
     black_kings = 0
 
-    gl.update_global_variables(board_size_x, board_size_y)
-    
-    clear_cache_gameboard()
-    move_mgr.clear_cache_move_mgr()
-    rules.clear_cache_rules()
+    use_board_size(board_size_x, board_size_y)
 
     for y in range(board_size_y):
         for x in range(board_size_x):
@@ -68,6 +67,36 @@ def create_bitboard_new_game(
     return white_pieces, white_kings, black_pieces, black_kings
 
 
+def use_board_size(board_size_x: int, board_size_y: int):
+    """Activate the geometry of a board, e.g. before working on a game of another size.\n
+    Geometry-dependent caches are only cleared if the size actually changes. 
+    Move generation switches to the code generated for the size (see `codegen`)."""
+
+    if (gl.BOARD_MASK is not None and 
+        gl.BOARD_SIZE_X == board_size_x and gl.BOARD_SIZE_Y == board_size_y):
+        return
+
+    gl.update_global_variables(board_size_x, board_size_y)
+    clear_cache_gameboard()
+    move_mgr.clear_cache_move_mgr()
+    rules.clear_cache_rules()
+    move_mgr.use_specialised(codegen.get_engine(board_size_x, board_size_y) if codegen.ENABLED else None)
+
+
+__geometry_lock = threading.RLock()
+
+
+@contextmanager
+def board_geometry(board_size_x: int, board_size_y: int):
+    """Context: Activate the geometry of a board and hold the engine lock meanwhile.\n
+    The geometry lives in module globals, so threads working on games of 
+    different sizes have to take turns (bot searches run in own processes)."""
+
+    with __geometry_lock:
+        use_board_size(board_size_x, board_size_y)
+        yield
+
+
 def print_bitboard_bitwise(
         white_pieces: int, 
         white_kings: int, 
@@ -224,6 +253,170 @@ def shift_up(pos_mask: int, reverse: bool = False) -> int:
         return pos_mask >> gl.BOARD_SIZE_X
 
 
+def neighbour_squares(mask: int) -> int:
+    """Set-wise orthogonal neighbours\n
+    Return: bitmask of all squares next to any square in `mask`"""
+    return (
+        ((mask & ~gl.RIGHT_COL_MASK) << 1) | ((mask & ~gl.LEFT_COL_MASK) >> 1) |
+        ((mask << gl.BOARD_SIZE_X) & gl.BOARD_MASK) | (mask >> gl.BOARD_SIZE_X)
+    )
+
+
+def reachable_right(gen: int, empty: int) -> int:
+    """Set-wise occluded fill (Kogge-Stone) to the right\n
+    Return: bitmask of all empty squares reachable by any piece in `gen` moving right"""
+    pro = empty & ~gl.LEFT_COL_MASK  # Squares in the left column can't be entered from the left
+    propagator = pro
+    shift = 1
+    while shift < gl.BOARD_SIZE_X:
+        gen |= propagator & (gen << shift)
+        propagator &= propagator << shift
+        shift <<= 1
+    return (gen << 1) & pro
+
+
+def reachable_left(gen: int, empty: int) -> int:
+    """Set-wise occluded fill (Kogge-Stone) to the left\n
+    Return: bitmask of all empty squares reachable by any piece in `gen` moving left"""
+    pro = empty & ~gl.RIGHT_COL_MASK  # Squares in the right column can't be entered from the right
+    propagator = pro
+    shift = 1
+    while shift < gl.BOARD_SIZE_X:
+        gen |= propagator & (gen >> shift)
+        propagator &= propagator >> shift
+        shift <<= 1
+    return (gen >> 1) & pro
+
+
+def reachable_down(gen: int, empty: int) -> int:
+    """Set-wise occluded fill (Kogge-Stone) downwards\n
+    Return: bitmask of all empty squares reachable by any piece in `gen` moving down"""
+    pro = empty & gl.BOARD_MASK
+    propagator = pro
+    steps = 1
+    while steps < gl.BOARD_SIZE_Y:
+        shift = steps * gl.BOARD_SIZE_X
+        gen |= propagator & (gen << shift)
+        propagator &= propagator << shift
+        steps <<= 1
+    return (gen << gl.BOARD_SIZE_X) & pro
+
+
+def reachable_up(gen: int, empty: int) -> int:
+    """Set-wise occluded fill (Kogge-Stone) upwards\n
+    Return: bitmask of all empty squares reachable by any piece in `gen` moving up"""
+    pro = empty & gl.BOARD_MASK
+    propagator = pro
+    steps = 1
+    while steps < gl.BOARD_SIZE_Y:
+        shift = steps * gl.BOARD_SIZE_X
+        gen |= propagator & (gen >> shift)
+        propagator &= propagator >> shift
+        steps <<= 1
+    return (gen >> gl.BOARD_SIZE_X) & pro
+
+
+def mirror_horizontal(bitmask: int) -> int:
+    """Reflect a bitmask at the vertical center line of the board (left <-> right)"""
+    mirrored = 0
+    for col in range(gl.BOARD_SIZE_X):
+        mirrored |= ((bitmask >> col) & gl.LEFT_COL_MASK) << (gl.BOARD_SIZE_X - 1 - col)
+    return mirrored
+
+
+def mirror_vertical(bitmask: int) -> int:
+    """Reflect a bitmask at the horizontal center line of the board (top <-> bottom)"""
+    mirrored = 0
+    for row in range(gl.BOARD_SIZE_Y):
+        row_bits = (bitmask >> (row * gl.BOARD_SIZE_X)) & gl.TOP_ROW_MASK
+        mirrored |= row_bits << ((gl.BOARD_SIZE_Y - 1 - row) * gl.BOARD_SIZE_X)
+    return mirrored
+
+
+def transform_bitmask(bitmask: int, mirror_h: bool, mirror_v: bool) -> int:
+    """Apply a symmetry of the board to a bitmask (both reflections are their own inverse)"""
+    if mirror_h:
+        bitmask = mirror_horizontal(bitmask)
+    if mirror_v:
+        bitmask = mirror_vertical(bitmask)
+    return bitmask
+
+
+def apply_symmetry(
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
+        moving_white: bool,
+        mirror_h: bool,
+        mirror_v: bool
+    ) -> tuple[int, int, int, int, bool]:
+    """Apply a symmetry of the rules to a position. The vertical reflection swaps the colors.\n
+    Return: white_pieces, white_kings, black_pieces, black_kings, moving_white"""
+
+    white_pieces, white_kings, black_pieces, black_kings = (
+        transform_bitmask(bitmask, mirror_h, mirror_v)
+        for bitmask in (white_pieces, white_kings, black_pieces, black_kings)
+    )
+    if mirror_v:
+        return black_pieces, black_kings, white_pieces, white_kings, not moving_white
+    return white_pieces, white_kings, black_pieces, black_kings, moving_white
+
+
+def get_canonical_symmetry(
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
+        moving_white: bool
+    ) -> tuple[bool, bool]:
+    """Get the symmetry that maps a position to its canonical form (see `get_canonical_position`).\n
+    Moves of the canonical position are mapped back with `transform_bitmask` and the same symmetry.\n
+    Return: mirror_h, mirror_v"""
+
+    position = (white_pieces, white_kings, black_pieces, black_kings, moving_white)
+    candidates = (
+        (apply_symmetry(*position, mirror_h, mirror_v), (mirror_h, mirror_v))
+        for mirror_h, mirror_v in ((False, False), (True, False), (False, True), (True, True))
+    )
+    return min(candidates)[1]
+
+
+def get_canonical_position(
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
+        moving_white: bool
+    ) -> tuple[tuple[int, int, int, int, bool], bool]:
+    """Get a symmetry-independent key of a position, e.g. for transposition or book lookups.\n
+    The rules are invariant under horizontal reflection and under vertical reflection with 
+    swapped colors (incl. the side to move), so all four variants share the same key.\n
+    Return: (white_pieces, white_kings, black_pieces, black_kings, moving_white), colors_swapped
+    - colors_swapped: True if the key describes the position with swapped colors 
+      (scores from the view of white have to be negated)
+    """
+
+    position = (white_pieces, white_kings, black_pieces, black_kings, moving_white)
+    mirror_h, mirror_v = get_canonical_symmetry(*position)
+    return apply_symmetry(*position, mirror_h, mirror_v), mirror_v
+
+
+def is_horizontally_symmetric(
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int
+    ) -> bool:
+    """Check if the position is identical to its left-right reflection"""
+    return (
+        mirror_horizontal(white_pieces) == white_pieces and
+        mirror_horizontal(white_kings) == white_kings and
+        mirror_horizontal(black_pieces) == black_pieces and
+        mirror_horizontal(black_kings) == black_kings
+    )
+
+
 def clear_cache_gameboard():
     shift_right.cache_clear()
     shift_left.cache_clear()
@@ -1,4 +1,4 @@
-import json, os
+import hashlib, json, os
 
 config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.json")
 
@@ -8,6 +8,20 @@ def load_config(path) -> dict:
     with open(path, "r") as f:
         return json.load(f)
 
+def get_search_config_hash(config: dict) -> str:
+    """Short hash of the settings that change the result (move, score) of a bot search.
+    Search results and logged games are tagged with it."""
+    values = {key: config[key] for key in SEARCH_CONFIG_KEYS}
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode()).hexdigest()[:16]
+
+SEARCH_CONFIG_KEYS = (
+    "minimax_points_per_king_capture",
+    "minimax_points_per_piece_capture",
+    "minimax_points_per_move_option",
+    "minimax_max_depth_capture",
+    "minimax_limits_by_board_size",
+)
+
 
 
 CONFIG = load_config(config_path)
@@ -15,6 +29,11 @@ CONFIG = load_config(config_path)
 DEBUG_MODE = CONFIG["debug_mode"]
 DEBUG_ANALYZE_MINIMAX_TIME = CONFIG["debug_analyze_minimax_time"]
 
+MIN_BOARD_SIZE = CONFIG["min_board_size"] # Supported board sizes (per side)
+MAX_BOARD_SIZE = CONFIG["max_board_size"]
+
+SEARCH_CONFIG_HASH = get_search_config_hash(CONFIG)
+
 BOARD_SIZE_X = CONFIG["default_board_size_x"]
 BOARD_SIZE_Y = CONFIG["default_board_size_y"]
 
@@ -0,0 +1,221 @@
+import math, threading
+
+# --------------------------------------------------------------------------
+# Minimal metrics registry with output in the Prometheus text format.
+#
+# Metrics are updated once per request or search (never per node), so an update
+# is a dict operation under a lock. Nothing is formatted until /metrics is scraped.
+# Each process has its own registry: bot workers send their numbers with the job result.
+# --------------------------------------------------------------------------
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEPTH_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 12)
+NODES_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+NODES_PER_SEC_BUCKETS = (1_000, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 1_000_000)
+
+
+class Counter:
+    """Monotonically increasing value per label combination"""
+
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {} if labelnames else {(): 0.0} # Unlabeled counters are reported from the start
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets per label combination"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: tuple, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        self._values = {} # labels --> [count per bucket (incl. +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        for key, counts in values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', {**labels, 'le': float(bound)}, cumulative
+            yield f'{self.name}_count', labels, cumulative
+            yield f'{self.name}_sum', labels, counts[-1]
+
+
+class Gauge:
+    """Current value, read by a callback at scrape time\n
+    The callback returns a number or a dict {label value (tuple): number}"""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str, callback, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labelnames = labelnames
+
+    def samples(self):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+__metrics = []
+__lock = threading.Lock()
+
+
+def register(metric):
+    """Add a metric to the output of `render`\n
+    Return: the metric"""
+    with __lock:
+        __metrics.append(metric)
+    return metric
+
+
+def counter(name: str, help: str, labelnames: tuple = ()) -> Counter:
+    return register(Counter(name, help, labelnames))
+
+
+def histogram(name: str, help: str, buckets: tuple = LATENCY_BUCKETS, labelnames: tuple = ()) -> Histogram:
+    return register(Histogram(name, help, buckets, labelnames))
+
+
+def gauge(name: str, help: str, callback, labelnames: tuple = ()) -> Gauge:
+    return register(Gauge(name, help, callback, labelnames))
+
+
+def render() -> str:
+    """Get all metrics in the Prometheus text exposition format (version 0.0.4)"""
+
+    with __lock:
+        metrics = list(__metrics)
+
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, labels, value in metric.samples():
+            if labels:
+                label_str = ','.join(f'{key}="{__format_label(val)}"' for key, val in labels.items())
+                lines.append(f'{name}{{{label_str}}} {__format_value(value)}')
+            else:
+                lines.append(f'{name} {__format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def __format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def __format_label(value) -> str:
+    if isinstance(value, float):
+        return __format_value(value) # Bucket bounds
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# --------------------------------------------------------------------------
+# Metrics of the app
+# --------------------------------------------------------------------------
+
+REQUEST_DURATION = histogram(
+    'latrones_http_request_duration_seconds',
+    'Time until the response (first chunk of streams) per route',
+    labelnames=('method', 'route', 'status')
+)
+BOT_SEARCHES = counter(
+    'latrones_bot_searches_total',
+    'Finished bot searches by final status',
+    labelnames=('status',)
+)
+BOT_SEARCH_DURATION = histogram(
+    'latrones_bot_search_duration_seconds',
+    'Time of a bot search in the worker (without queue wait)'
+)
+BOT_QUEUE_WAIT = histogram(
+    'latrones_bot_queue_wait_seconds',
+    'Time a bot job waited for a free worker'
+)
+BOT_NODES = counter(
+    'latrones_bot_nodes_total',
+    'Minimax nodes searched by the bot'
+)
+BOT_QUIESCENCE_NODES = counter(
+    'latrones_bot_quiescence_nodes_total',
+    'Minimax nodes beyond the normal max. depth (capture extension)'
+)
+BOT_CUTOFFS = counter(
+    'latrones_bot_cutoffs_total',
+    'Alpha-beta cutoffs of the bot search'
+)
+BOT_FIRST_MOVE_CUTOFFS = counter(
+    'latrones_bot_first_move_cutoffs_total',
+    'Alpha-beta cutoffs by the first searched move'
+)
+BOT_NODES_PER_SEARCH = histogram(
+    'latrones_bot_search_nodes',
+    'Minimax nodes per bot search',
+    buckets=NODES_BUCKETS
+)
+BOT_NODES_PER_SEC = histogram(
+    'latrones_bot_nodes_per_second',
+    'Search speed of a bot search',
+    buckets=NODES_PER_SEC_BUCKETS
+)
+BOT_DEPTH = histogram(
+    'latrones_bot_search_depth',
+    'Depth of the last completed iteration of a bot search',
+    buckets=DEPTH_BUCKETS
+)
+BOT_TIMEOUTS = counter(
+    'latrones_bot_search_timeouts_total',
+    'Bot searches stopped by their time limit'
+)
+BOT_DEGRADED = counter(
+    'latrones_bot_searches_degraded_total',
+    'Bot searches with limits lowered by the scheduler (load)'
+)
+POSITION_CACHE_LOOKUPS = counter(
+    'latrones_position_cache_lookups_total',
+    'Lookups of bot searches in the position cache',
+    labelnames=('result',)
+)
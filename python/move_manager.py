@@ -3,6 +3,18 @@ from . import gameboard as gameboard
 from . import global_variables as gl
 from functools import cache
 
+__specialised = None # Generated functions of the active board geometry (see codegen), None: generic code
+
+
+def use_specialised(engine):
+    """Use the generated functions of `codegen.get_engine(...)` for move generation and moves (None: generic code)"""
+    global __specialised
+    __specialised = engine
+
+
+def get_specialised():
+    return __specialised
+
 
 def find_legal_moves_on_bitboard(
         white_pieces: int,
@@ -12,6 +24,11 @@ def find_legal_moves_on_bitboard(
         moving_white: bool
     ):
 
+    if __specialised is not None:
+        return __specialised.find_legal_moves_on_bitboard(
+            white_pieces, white_kings, black_pieces, black_kings, moving_white
+        )
+
     my_pieces = white_pieces if moving_white else black_pieces
     my_kings = white_kings if moving_white else black_kings
     my_all = my_pieces | my_kings
@@ -207,6 +224,11 @@ def apply_move(
     Return: white_pieces, white_kings, black_pieces, black_kings, captured_mask
     """
 
+    if __specialised is not None:
+        return __specialised.apply_move(
+            white_pieces, white_kings, black_pieces, black_kings, cur_mask, dst_mask
+        )
+
     # Relocate pieces (apply move)
     if white_kings & cur_mask:
         white_kings = __relocate_piece_on_bitmask(white_kings, cur_mask, dst_mask)
@@ -235,6 +257,51 @@ def apply_move(
     return white_pieces, white_kings, black_pieces, black_kings, captured_mask
 
 
+def perft(
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
+        moving_white: bool,
+        depth: int
+    ) -> int:
+    """Count the move sequences of a given length (leaf nodes of the full move tree).
+    Finished games are leaves, i.e. no moves are generated after a win.\n
+    Used to verify and benchmark the move generation.\n
+    Return: number of leaf nodes"""
+
+    if depth == 0:
+        return 1
+
+    legal_moves = find_legal_moves_on_bitboard(
+        white_pieces, white_kings,
+        black_pieces, black_kings,
+        moving_white
+    )
+    if depth == 1:
+        return len(legal_moves)
+
+    nodes = 0
+    for cur_mask, dst_mask in legal_moves:
+        (white_pieces_new, white_kings_new,
+         black_pieces_new, black_kings_new, _) = apply_move(
+            white_pieces, white_kings,
+            black_pieces, black_kings,
+            cur_mask, dst_mask
+        )
+        if any(rules.check_for_winner(white_pieces_new, white_kings_new, black_pieces_new, black_kings_new)):
+            nodes += 1 # Game over: no further moves
+            continue
+
+        nodes += perft(
+            white_pieces_new, white_kings_new,
+            black_pieces_new, black_kings_new,
+            not moving_white,
+            depth - 1
+        )
+    return nodes
+
+
 @cache
 def __relocate_piece_on_bitmask(
         pieces_bitmask: int,
@@ -0,0 +1,94 @@
+from . import global_variables as gl
+
+import re
+
+# --------------------------------------------------------------------------
+# Compact text notation of a position (similar to FEN):
+#
+#   "<X>x<Y> <row 0>/<row 1>/.../<row Y-1> <side to move>"
+#
+#   - Rows from y = 0 to y = Y-1, squares from x = 0 to x = X-1
+#   - w: white piece, W: white king, b: black piece, B: black king
+#   - Numbers: count of empty squares
+#   - Side to move: w or b
+#
+#   e.g. 8x8 bbbbbbbb/3B4/8/8/8/8/4W3/wwwwwwww w
+# --------------------------------------------------------------------------
+
+PIECE_CHARS = 'wWbB' # Order of the bitboards: white_pieces, white_kings, black_pieces, black_kings
+
+__RUN_PATTERN = re.compile(r'\d+')
+__EMPTY_PATTERN = re.compile(r'\.+')
+__DELETE_KNOWN_CHARS = str.maketrans('', '', '.' + PIECE_CHARS)
+__PIECE_TABLES = tuple( # Per bitboard: its piece char --> '1', everything else --> '0'
+    str.maketrans({char: ('1' if char == piece_char else '0') for char in PIECE_CHARS + '.'})
+    for piece_char in PIECE_CHARS
+)
+
+
+def from_notation(text: str) -> tuple[int, int, int, int, int, int, bool]:
+    """Parse a position in notation\n
+    Raises ValueError if the text is not a valid position.\n
+    Return: board_size_x, board_size_y, white_pieces, white_kings, black_pieces, black_kings, moving_white"""
+
+    try:
+        size, rows, side = text.split()
+        board_size_x, board_size_y = (int(value) for value in size.split('x'))
+    except ValueError:
+        raise ValueError(f'Position notation {text!r} is not "<X>x<Y> <rows> <w|b>"') from None
+
+    if side not in ('w', 'b'):
+        raise ValueError(f'Side to move {side!r} is not w or b')
+
+    if not (gl.MIN_BOARD_SIZE <= board_size_x <= gl.MAX_BOARD_SIZE and gl.MIN_BOARD_SIZE <= board_size_y <= gl.MAX_BOARD_SIZE):
+        raise ValueError(f'Board size {board_size_x}x{board_size_y} is not supported '
+                         f'({gl.MIN_BOARD_SIZE} to {gl.MAX_BOARD_SIZE} squares per side)')
+
+    # Check the length of every row before the empty runs are expanded
+    row_list = rows.split('/')
+    if len(row_list) != board_size_y or any(
+        len(__RUN_PATTERN.sub('', row)) + sum(int(run) for run in __RUN_PATTERN.findall(row)) != board_size_x
+        for row in row_list
+    ):
+        raise ValueError(f'Position notation {text!r} does not fit a {board_size_x}x{board_size_y} board')
+
+    # Expand empty runs: one char per square, square index y * X + x
+    squares = ''.join(__RUN_PATTERN.sub(lambda match: '.' * int(match.group()), row) for row in row_list)
+    if squares.translate(__DELETE_KNOWN_CHARS):
+        raise ValueError(f'Position notation {text!r} contains unknown pieces')
+
+    # Bit strings are written from the highest square to the lowest
+    reversed_squares = squares[::-1]
+    white_pieces, white_kings, black_pieces, black_kings = (
+        int(reversed_squares.translate(table), 2) for table in __PIECE_TABLES
+    )
+
+    return board_size_x, board_size_y, white_pieces, white_kings, black_pieces, black_kings, side == 'w'
+
+
+def to_notation(
+        board_size_x: int,
+        board_size_y: int,
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
+        moving_white: bool
+    ) -> str:
+    """Write a position in notation\n
+    Return: e.g. "8x8 bbbbbbbb/3B4/8/8/8/8/4W3/wwwwwwww w" """
+
+    squares = ['.'] * (board_size_x * board_size_y)
+    for piece_char, bitmask in zip(PIECE_CHARS, (white_pieces, white_kings, black_pieces, black_kings)):
+        while bitmask:
+            pos_mask = bitmask & -bitmask # Isolate lowest set bit
+            squares[pos_mask.bit_length() - 1] = piece_char
+            bitmask ^= pos_mask
+
+    squares = ''.join(squares)
+    rows = '/'.join(
+        squares[y * board_size_x:(y + 1) * board_size_x] for y in range(board_size_y)
+    )
+    rows = __EMPTY_PATTERN.sub(lambda match: str(len(match.group())), rows)
+
+    return f'{board_size_x}x{board_size_y} {rows} {"w" if moving_white else "b"}'
@@ -0,0 +1,205 @@
+from . import global_variables as gl
+from . import gameboard
+
+from collections import OrderedDict
+import os, sqlite3, threading
+
+MAX_ENTRIES = gl.CONFIG["position_cache_max_entries"] # In-memory entries (least recently used are dropped)
+CACHE_PATH = gl.CONFIG["position_cache_path"] # SQLite file shared by all processes ("": memory only)
+
+if CACHE_PATH and not os.path.isabs(CACHE_PATH):
+    CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), CACHE_PATH)
+
+
+# --------------------------------------------------------------------------
+# Cache of searched positions: best move, score and search depth
+#
+# Positions are stored in their canonical form (see gameboard.get_canonical_position),
+# so symmetric positions share one entry. Scores are from the view of the side to move
+# and therefore need no conversion when the colors are swapped.
+#
+# Keys start with the hash of the search settings (`gl.SEARCH_CONFIG_HASH`): results of
+# other evaluation weights or capture depths are never used and are deleted from the file
+# when a process opens it.
+# --------------------------------------------------------------------------
+
+__entries: OrderedDict[str, tuple[int, int, float, int]] = OrderedDict()
+__lock = threading.Lock()
+__connection = None
+__connection_pid = None
+
+
+def lookup(
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
+        moving_white: bool,
+        min_depth: int
+    ) -> tuple[tuple[int, int], float, int]:
+    """Get the stored search result of a position (current board geometry).\n
+    Only results searched at least `min_depth` deep are returned.\n
+    Return: (cur_mask, dst_mask), score, depth - or None"""
+
+    mirror_h, mirror_v = gameboard.get_canonical_symmetry(
+        white_pieces, white_kings, black_pieces, black_kings, moving_white
+    )
+    key = __get_key(white_pieces, white_kings, black_pieces, black_kings, moving_white, mirror_h, mirror_v)
+
+    with __lock:
+        entry = __entries.get(key)
+        if entry is not None:
+            __entries.move_to_end(key)
+        else:
+            entry = __load_entry(key)
+            if entry is not None:
+                __remember(key, entry)
+
+    if entry is None or entry[3] < min_depth:
+        return None
+
+    cur_mask, dst_mask, score, depth = entry
+    move = (gameboard.transform_bitmask(cur_mask, mirror_h, mirror_v),
+            gameboard.transform_bitmask(dst_mask, mirror_h, mirror_v))
+    return move, score, depth
+
+
+def store(
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
+        moving_white: bool,
+        best_move: tuple[int, int],
+        score: float,
+        depth: int
+    ):
+    """Store the search result of a position (current board geometry).\n
+    Existing results of deeper searches are kept (in memory and in the file)."""
+
+    mirror_h, mirror_v = gameboard.get_canonical_symmetry(
+        white_pieces, white_kings, black_pieces, black_kings, moving_white
+    )
+    key = __get_key(white_pieces, white_kings, black_pieces, black_kings, moving_white, mirror_h, mirror_v)
+    entry = (
+        gameboard.transform_bitmask(best_move[0], mirror_h, mirror_v),
+        gameboard.transform_bitmask(best_move[1], mirror_h, mirror_v),
+        score,
+        depth
+    )
+
+    with __lock:
+        known_entry = __entries.get(key)
+        if known_entry is not None and known_entry[3] > depth:
+            return
+
+        __save_entry(key, entry)
+        # The file may hold a deeper result (dropped from memory or stored by another process)
+        stored_entry = __load_entry(key)
+        __remember(key, entry if stored_entry is None or stored_entry[3] <= depth else stored_entry)
+
+
+def clear():
+    """Forget all positions in memory (the file is kept)"""
+    with __lock:
+        __entries.clear()
+
+
+def __get_key(
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
+        moving_white: bool,
+        mirror_h: bool,
+        mirror_v: bool
+    ) -> str:
+    """Encode search settings, board size and canonical position as text"""
+
+    (white_pieces, white_kings,
+     black_pieces, black_kings, moving_white) = gameboard.apply_symmetry(
+        white_pieces, white_kings, black_pieces, black_kings, moving_white, mirror_h, mirror_v
+    )
+    return (f'{gl.SEARCH_CONFIG_HASH}:{gl.BOARD_SIZE_X}x{gl.BOARD_SIZE_Y}:'
+            f'{white_pieces:x}:{white_kings:x}:{black_pieces:x}:{black_kings:x}:{int(moving_white)}')
+
+
+def __remember(key: str, entry: tuple[int, int, float, int]):
+    """Put an entry into the in-memory LRU (lock must be held)"""
+
+    __entries[key] = entry
+    __entries.move_to_end(key)
+    while len(__entries) > MAX_ENTRIES:
+        __entries.popitem(last=False)
+
+
+# --------------------------------------------------------------------------
+# SQLite store (masks as hex text: boards can exceed 64 bits)
+# --------------------------------------------------------------------------
+
+def __get_connection() -> sqlite3.Connection:
+    """Open the database once per process (lock must be held)\n
+    Return: connection or None if the cache is memory only"""
+
+    global __connection, __connection_pid
+
+    if not CACHE_PATH:
+        return None
+
+    if __connection is None or __connection_pid != os.getpid():
+        __connection = sqlite3.connect(CACHE_PATH, timeout=5.0, check_same_thread=False)
+        __connection.execute('PRAGMA journal_mode=WAL') # Readers do not block the writer (several workers)
+        __connection.execute('PRAGMA synchronous=NORMAL')
+        __connection.execute(
+            'CREATE TABLE IF NOT EXISTS positions ('
+            'key TEXT PRIMARY KEY, cur_mask TEXT, dst_mask TEXT, score REAL, depth INTEGER)'
+        )
+        with __connection:
+            # Results of other search settings can never be used again
+            __connection.execute(
+                'DELETE FROM positions WHERE substr(key, 1, ?) != ?',
+                (len(gl.SEARCH_CONFIG_HASH) + 1, gl.SEARCH_CONFIG_HASH + ':')
+            )
+        __connection_pid = os.getpid()
+
+    return __connection
+
+
+def __load_entry(key: str) -> tuple[int, int, float, int]:
+    """Read an entry from the database (lock must be held)"""
+
+    try:
+        connection = __get_connection()
+        if connection is None:
+            return None
+        row = connection.execute(
+            'SELECT cur_mask, dst_mask, score, depth FROM positions WHERE key = ?', (key,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f'Position cache not readable: {e}')
+        return None
+
+    if row is None:
+        return None
+    return int(row[0], 16), int(row[1], 16), row[2], row[3]
+
+
+def __save_entry(key: str, entry: tuple[int, int, float, int]):
+    """Write an entry to the database, unless a deeper result is stored (lock must be held)"""
+
+    cur_mask, dst_mask, score, depth = entry
+    try:
+        connection = __get_connection()
+        if connection is None:
+            return
+        with connection:
+            connection.execute(
+                'INSERT INTO positions (key, cur_mask, dst_mask, score, depth) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET '
+                'cur_mask = excluded.cur_mask, dst_mask = excluded.dst_mask, '
+                'score = excluded.score, depth = excluded.depth '
+                'WHERE excluded.depth >= positions.depth',
+                (key, format(cur_mask, 'x'), format(dst_mask, 'x'), score, depth)
+            )
+    except sqlite3.Error as e:
+        print(f'Position cache not writable: {e}')
@@ -0,0 +1,134 @@
+from . import global_variables as gl
+
+import cProfile, io, os, pstats, random, sys, threading, time
+
+PROFILE_DIR = gl.CONFIG["profiling_dir"] # Directory of the profile dumps
+SAMPLE_INTERVAL_SEC = gl.CONFIG["profiling_sample_interval_ms"] / 1000 # Time between two stack samples
+ADMIN_TOKEN = gl.CONFIG["profiling_admin_token"] # Required to request profiles ("": profiling by request disabled)
+
+if not os.path.isabs(PROFILE_DIR):
+    PROFILE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), PROFILE_DIR)
+
+MODE_SAMPLING = 'sampling' # Stack samples of a background thread (low overhead) --> collapsed stacks
+MODE_CPROFILE = 'cprofile' # Deterministic profiler (high overhead, exact call counts) --> pstats
+MODES = (MODE_SAMPLING, MODE_CPROFILE)
+
+__sample_rate = gl.CONFIG["profiling_sample_rate"] # Fraction of all bot searches to profile
+__sample_mode = MODE_SAMPLING
+__lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """Sample the call stack of a thread in fixed intervals from a background thread.\n
+    The profiled thread runs at full speed; the result is a map of collapsed stacks
+    ("outer;...;inner" --> number of samples), e.g. for flame graphs."""
+
+    def __init__(self, interval_sec: float = SAMPLE_INTERVAL_SEC, thread_id: int = None):
+        self.interval_sec = interval_sec
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.stacks = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval_sec):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return # Thread ended
+
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            stack = ';'.join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def to_collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items()))
+
+
+def set_sampling(sample_rate: float, mode: str = MODE_SAMPLING):
+    """Profile a fraction of all bot searches from now on (0: off)"""
+
+    global __sample_rate, __sample_mode
+
+    if mode not in MODES:
+        raise ValueError(f'Unknown profiling mode {mode!r} (expected one of {MODES})')
+    with __lock:
+        __sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        __sample_mode = mode
+
+
+def get_sampling() -> dict:
+    with __lock:
+        return {'sample_rate': __sample_rate, 'mode': __sample_mode}
+
+
+def choose_mode(requested_mode: str = None) -> str:
+    """Decide if a search is profiled: explicitly requested or randomly sampled\n
+    Return: profiling mode or None"""
+
+    if requested_mode is not None:
+        if requested_mode not in MODES:
+            raise ValueError(f'Unknown profiling mode {requested_mode!r} (expected one of {MODES})')
+        return requested_mode
+
+    with __lock:
+        if __sample_rate > 0 and random.random() < __sample_rate:
+            return __sample_mode
+    return None
+
+
+def is_authorized(token: str) -> bool:
+    """Check the admin token of a profiling request"""
+    return bool(ADMIN_TOKEN) and token == ADMIN_TOKEN
+
+
+def run_profiled(mode: str, name: str, func, *args, **kwargs):
+    """Run `func(*args, **kwargs)` with a profiler and write the dump to `PROFILE_DIR`\n
+    Return: result of func, path of the dump (None if not profiled)"""
+
+    if mode is None:
+        return func(*args, **kwargs), None
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path_base = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}_{name}')
+
+    if mode == MODE_SAMPLING:
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.stop()
+            path = path_base + '.collapsed'
+            with open(path, 'w') as f:
+                f.write(profiler.to_collapsed())
+        return result, path
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        path = path_base + '.pstats'
+        profiler.dump_stats(path)
+    return result, path
+
+
+def format_pstats(path: str, lines: int = 30) -> str:
+    """Get the top functions (cumulative time) of a pstats dump as text"""
+
+    stream = io.StringIO()
+    pstats.Stats(path, stream=stream).sort_stats('cumulative').print_stats(lines)
+    return stream.getvalue()
@@ -180,6 +180,37 @@ def find_captures_after_move(
     return captured_mask
 
 
+def find_capture_squares(
+        white_pieces: int,
+        white_kings: int,
+        black_pieces: int,
+        black_kings: int,
+        moving_white: bool
+    ) -> int:
+    """Set-wise filter for captures: A move of a piece can only capture if its destination is next
+    to an opponent piece (lines, groups, king) or an own king. If a king is trapped already (or a
+    color has several kings), any move may capture. Moves of a king are not covered: it may be
+    trapped at its destination.\n
+    Return: bitmask of the destination squares of possibly capturing piece moves of the moving color"""
+
+    specialised = move_mgr.get_specialised()
+    if specialised is not None:
+        return specialised.find_capture_squares(
+            white_pieces, white_kings, black_pieces, black_kings, moving_white
+        )
+
+    all_pieces = white_pieces | white_kings | black_pieces | black_kings
+    if (white_kings & (white_kings - 1) or black_kings & (black_kings - 1) or
+            __is_king_trapped(white_kings, all_pieces) or __is_king_trapped(black_kings, all_pieces)):
+        return gl.BOARD_MASK
+
+    if moving_white:
+        mask = black_pieces | black_kings | white_kings
+    else:
+        mask = white_pieces | white_kings | black_kings
+    return gameboard.neighbour_squares(mask)
+
+
 def __find_trapped_group(
         opponent_mask: int, # Kings and normal pieces of the group
         all_pieces: int, # All piecees on bitboard
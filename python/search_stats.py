@@ -0,0 +1,56 @@
+from dataclasses import dataclass, field, asdict
+import time
+
+
+@dataclass
+class SearchStats:
+    """Statistics of a single bot search (see `bot.find_move_for_bot(..., return_stats=True)`)\n
+    - nodes: Calls of the minimax function
+    - quiescence_nodes: Nodes beyond the normal max. depth (capture extension)
+    - extensions: Captures at the normal max. depth that extended the search
+    - cutoffs: Alpha-beta cutoffs
+    - first_move_cutoffs: Cutoffs already caused by the first searched move (move ordering quality)
+    - iterations: [{'depth', 'elapsed_sec', 'best_move', 'score', 'nodes'}, ...] of completed iterations
+    - timeout_reason: Why the search stopped early (cancellation reason, None if completed)
+    - cache_hit: Result taken from the position cache (nothing searched)
+    """
+    nodes: int = 0
+    quiescence_nodes: int = 0
+    extensions: int = 0
+    cutoffs: int = 0
+    first_move_cutoffs: int = 0
+    iterations: list = field(default_factory=list)
+    timeout_reason: str = None
+    cache_hit: bool = False
+    start_time: float = field(default_factory=time.time)
+    elapsed_sec: float = 0.0
+
+    def depth(self) -> int:
+        """Depth of the last completed iteration (0 if none)"""
+        return self.iterations[-1]['depth'] if self.iterations else 0
+
+    def first_move_cutoff_rate(self) -> float:
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def nodes_per_sec(self) -> float:
+        return self.nodes / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+
+    def add_iteration(self, depth: int, best_move: tuple[int, int], score: float):
+        self.iterations.append({
+            'depth': depth,
+            'elapsed_sec': time.time() - self.start_time,
+            'best_move': best_move,
+            'score': score,
+            'nodes': self.nodes,
+        })
+
+    def finish(self):
+        self.elapsed_sec = time.time() - self.start_time
+
+    def to_dict(self) -> dict:
+        """Plain values incl. derived numbers (e.g. for JSON or other processes)"""
+        stats = asdict(self)
+        stats['depth'] = self.depth()
+        stats['first_move_cutoff_rate'] = self.first_move_cutoff_rate()
+        stats['nodes_per_sec'] = self.nodes_per_sec()
+        return stats
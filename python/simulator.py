@@ -0,0 +1,212 @@
+from . import gameboard
+from . import game_log
+from . import move_manager as move_mgr
+from . import rules
+
+from dataclasses import dataclass, field
+import random
+
+# --------------------------------------------------------------------------
+# Lockstep simulation of many independent games (self-play data, tuning)
+#
+# All games of a simulator share one board size, so the board geometry is
+# activated once per step instead of once per game (a switch clears the
+# caches of the engine), and the policy is called once per step for all
+# games. Move generation, moves and winner checks still run game by game in
+# a Python loop: the moves of a game depend on its own pieces, so they are
+# not computed set-wise across games. A move is applied at most once per
+# step (`resolve` shares the result between policy and step). Finished games
+# are retired and replaced by a new game in the same slot.
+# --------------------------------------------------------------------------
+
+END_WIN = 'win'
+END_NO_MOVES = 'no_moves' # Side to move has no legal move (counted as draw)
+END_MAX_PLIES = 'max_plies' # Stopped after `max_plies` moves (counted as draw)
+
+
+@dataclass
+class SimulatedGame:
+    """A finished game of the simulator (can be passed to `game_log.record_game`)"""
+    game_id: int
+    board_size_x: int
+    board_size_y: int
+    user_is_white: bool
+    white_wins: bool
+    black_wins: bool
+    end_reason: str
+    history: list = field(default_factory=list) # Played moves [(cur_mask, dst_mask), ...]
+    play_against_bot: bool = False
+    game_time_seconds: float = None
+
+    def winner(self) -> int:
+        return game_log.WINNER_WHITE if self.white_wins else game_log.WINNER_BLACK if self.black_wins else game_log.WINNER_NONE
+
+
+def random_policy(positions: list, legal_moves: list[list[tuple[int, int]]], rng: random.Random, resolve) -> list[int]:
+    """Choose a random legal move in every game\n
+    Return: index of the chosen move per game"""
+    return [rng.randrange(len(moves)) for moves in legal_moves]
+
+
+def capture_policy(positions: list, legal_moves: list[list[tuple[int, int]]], rng: random.Random, resolve) -> list[int]:
+    """Choose a random capturing move if a game has one, otherwise a random move.\n
+    Only moves that may capture (see `rules.find_capture_squares`) are resolved.\n
+    Return: index of the chosen move per game"""
+
+    choices = []
+    for game_index, (position, moves) in enumerate(zip(positions, legal_moves)):
+        white_pieces, white_kings, black_pieces, black_kings, moving_white = position
+        capture_squares = rules.find_capture_squares(white_pieces, white_kings, black_pieces, black_kings, moving_white)
+        my_kings = white_kings if moving_white else black_kings
+        captures = [
+            move_index for move_index, (cur_mask, dst_mask) in enumerate(moves)
+            if (dst_mask & capture_squares or cur_mask & my_kings) and resolve(game_index, move_index)[4]
+        ]
+        choices.append(rng.choice(captures) if captures else rng.randrange(len(moves)))
+    return choices
+
+
+class LockstepSimulator:
+    """Advance `number_of_games` games of one board size in lockstep.\n
+    `policy(positions, legal_moves, rng, resolve)` chooses the moves of all games of a step at once
+    (positions: [(white_pieces, white_kings, black_pieces, black_kings, moving_white), ...]).
+    `resolve(game_index, move_index)` returns the result of `move_mgr.apply_move` for a move;
+    it is computed once and reused when the step plays the chosen move.\n
+    Not thread-safe: a step holds the board geometry of the engine (see `gameboard.board_geometry`)."""
+
+    def __init__(
+            self,
+            board_size_x: int,
+            board_size_y: int,
+            number_of_games: int,
+            policy = random_policy,
+            max_plies: int = 300,
+            user_is_white: bool = True,
+            seed: int = None
+        ):
+        self.board_size_x = board_size_x
+        self.board_size_y = board_size_y
+        self.policy = policy
+        self.max_plies = max_plies
+        self.user_is_white = user_is_white
+        self.rng = random.Random(seed)
+        self.started_games = 0
+
+        with gameboard.board_geometry(board_size_x, board_size_y):
+            self.initial_bitboard = tuple(gameboard.create_bitboard_new_game(
+                board_size_x=board_size_x,
+                board_size_y=board_size_y,
+                user_is_white=user_is_white
+            ))
+
+        # Parallel arrays: one slot per running game
+        self.white_pieces = []
+        self.white_kings = []
+        self.black_pieces = []
+        self.black_kings = []
+        self.moving_white = []
+        self.histories = []
+        self.game_ids = []
+        for _ in range(number_of_games):
+            self.white_pieces.append(0)
+            self.white_kings.append(0)
+            self.black_pieces.append(0)
+            self.black_kings.append(0)
+            self.moving_white.append(True)
+            self.histories.append(None)
+            self.game_ids.append(None)
+            self._start_game(len(self.game_ids) - 1)
+
+    def step(self) -> list[SimulatedGame]:
+        """Play one move in every running game\n
+        Return: games finished in this step (their slots already hold new games)"""
+
+        finished = []
+        with gameboard.board_geometry(self.board_size_x, self.board_size_y):
+            positions = list(zip(
+                self.white_pieces, self.white_kings,
+                self.black_pieces, self.black_kings,
+                self.moving_white
+            ))
+            legal_moves = [move_mgr.find_legal_moves_on_bitboard(*position) for position in positions]
+
+            # Games without a move end before the policy is asked
+            playable = []
+            for slot, moves in enumerate(legal_moves):
+                if moves:
+                    playable.append(slot)
+                else:
+                    finished.append(self._finish_game(slot, False, False, END_NO_MOVES))
+            if not playable:
+                return finished
+
+            playable_positions = [positions[slot] for slot in playable]
+            playable_moves = [legal_moves[slot] for slot in playable]
+            applied = {} # (game index, move index) --> result of move_mgr.apply_move
+
+            def resolve(game_index: int, move_index: int) -> tuple[int, int, int, int, int]:
+                result = applied.get((game_index, move_index))
+                if result is None:
+                    cur_mask, dst_mask = playable_moves[game_index][move_index]
+                    result = move_mgr.apply_move(*playable_positions[game_index][:4], cur_mask, dst_mask)
+                    applied[(game_index, move_index)] = result
+                return result
+
+            choices = self.policy(playable_positions, playable_moves, self.rng, resolve)
+
+            for game_index, (slot, choice) in enumerate(zip(playable, choices)):
+                cur_mask, dst_mask = playable_moves[game_index][choice]
+                (white_pieces, white_kings,
+                 black_pieces, black_kings, _) = resolve(game_index, choice)
+
+                self.white_pieces[slot] = white_pieces
+                self.white_kings[slot] = white_kings
+                self.black_pieces[slot] = black_pieces
+                self.black_kings[slot] = black_kings
+                self.moving_white[slot] = not self.moving_white[slot]
+                self.histories[slot].append((cur_mask, dst_mask))
+
+                white_wins, black_wins = rules.check_for_winner(white_pieces, white_kings, black_pieces, black_kings)
+                if white_wins or black_wins:
+                    finished.append(self._finish_game(slot, white_wins, black_wins, END_WIN))
+                elif len(self.histories[slot]) >= self.max_plies:
+                    finished.append(self._finish_game(slot, False, False, END_MAX_PLIES))
+
+        return finished
+
+    def run(self, number_of_games: int, on_finished = None) -> list[SimulatedGame]:
+        """Step until at least `number_of_games` games are finished (running games are kept for the next call)\n
+        `on_finished(game)` is called for every finished game, e.g. `game_log.record_game`.\n
+        Return: the finished games"""
+
+        games = []
+        while len(games) < number_of_games:
+            for game in self.step():
+                games.append(game)
+                if on_finished is not None:
+                    on_finished(game)
+        return games
+
+    def _start_game(self, slot: int):
+        (self.white_pieces[slot], self.white_kings[slot],
+         self.black_pieces[slot], self.black_kings[slot]) = self.initial_bitboard
+        self.moving_white[slot] = True
+        self.histories[slot] = []
+        self.game_ids[slot] = self.started_games
+        self.started_games += 1
+
+    def _finish_game(self, slot: int, white_wins: bool, black_wins: bool, end_reason: str) -> SimulatedGame:
+        """Retire the game of a slot and start a new one in its place"""
+
+        game = SimulatedGame(
+            game_id=self.game_ids[slot],
+            board_size_x=self.board_size_x,
+            board_size_y=self.board_size_y,
+            user_is_white=self.user_is_white,
+            white_wins=white_wins,
+            black_wins=black_wins,
+            end_reason=end_reason,
+            history=self.histories[slot]
+        )
+        self._start_game(slot)
+        return game
@@ -0,0 +1,75 @@
+from . import global_variables as gl
+
+from dataclasses import dataclass, field
+import time
+
+MOVES_TO_GO = gl.CONFIG["minimax_time_moves_to_go"] # Expected number of remaining bot moves to split the clock on
+HARD_LIMIT_FACTOR = gl.CONFIG["minimax_time_hard_limit_factor"] # Hard limit as multiple of the soft limit
+STABLE_ITERATIONS = gl.CONFIG["minimax_time_stable_iterations"] # Stop after X iterations with unchanged best move
+SCORE_DROP_POINTS = gl.CONFIG["minimax_time_score_drop_points"] # Score drop between iterations that extends the time
+SCORE_DROP_EXTENSION = gl.CONFIG["minimax_time_score_drop_extension"] # Factor to extend the soft limit by
+SAFETY_MARGIN_SEC = 0.5 # Clock reserve for network and rendering, never spent on searching
+
+
+@dataclass
+class TimeManager:
+    """Time limits of a single bot move\n
+    - soft_limit_sec: No new iteration is started after this time
+    - hard_limit_sec: The search is stopped after this time
+    """
+    soft_limit_sec: float
+    hard_limit_sec: float
+    start_time: float = field(default_factory=time.time)
+    best_move: tuple[int, int] = None
+    best_score: float = None
+    stable_iterations: int = 0
+
+    def elapsed(self) -> float:
+        return time.time() - self.start_time
+
+    def is_hard_limit_reached(self) -> bool:
+        return self.elapsed() > self.hard_limit_sec
+
+    def register_iteration(self, best_move: tuple[int, int], best_score: float):
+        """Track the result of a completed iteration:
+        Count stable best moves and extend the soft limit if the score drops"""
+
+        if best_move == self.best_move:
+            self.stable_iterations += 1
+        else:
+            self.stable_iterations = 0
+
+        if self.best_score is not None and self.best_score - best_score >= SCORE_DROP_POINTS:
+            self.soft_limit_sec = min(self.soft_limit_sec * SCORE_DROP_EXTENSION, self.hard_limit_sec)
+
+        self.best_move = best_move
+        self.best_score = best_score
+
+    def should_start_iteration(self) -> bool:
+        """Check if there is time and need for another (deeper) iteration"""
+
+        if self.stable_iterations >= STABLE_ITERATIONS:
+            return False
+        return self.elapsed() < self.soft_limit_sec
+
+
+def create_time_manager(
+        max_time_sec: float,
+        remaining_time_sec: float = None,
+        increment_sec: float = 0.0
+    ) -> TimeManager:
+    """Allocate the time for the next bot move from the remaining clock\n
+    Without clock the fixed `max_time_sec` is used as soft and hard limit"""
+
+    if remaining_time_sec is None:
+        return TimeManager(soft_limit_sec=max_time_sec, hard_limit_sec=max_time_sec)
+
+    available_sec = max(remaining_time_sec - SAFETY_MARGIN_SEC, 0.0)
+
+    soft_limit_sec = available_sec / MOVES_TO_GO + increment_sec
+    hard_limit_sec = min(soft_limit_sec * HARD_LIMIT_FACTOR, available_sec / 4 + increment_sec)
+
+    soft_limit_sec = min(soft_limit_sec, max_time_sec)
+    hard_limit_sec = max(min(hard_limit_sec, max_time_sec), soft_limit_sec)
+
+    return TimeManager(soft_limit_sec=soft_limit_sec, hard_limit_sec=hard_limit_sec)
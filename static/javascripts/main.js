@@ -1,6 +1,7 @@
 // Define static global variables
 COLOR_LIGHT = 'light'
 COLOR_DARK = 'dark'
+BOT_REQUEST_TIMEOUT_MS = 30000
 
 
 // Start the function bind_events() after loading the HTML
@@ -11,6 +12,22 @@ $(document).ready(
 );
 
 
+// Start a new game if the server does not know the game anymore (e.g. evicted after idling)
+$(document).ajaxError(function (event, xhr) {
+    if (xhr.status === 404) {
+      window.location.href = '/play';
+    }
+});
+
+
+// Stop the bot search on the server if the tab is closed
+window.addEventListener('pagehide', function () {
+    if (window.botJob) {
+      cancel_bot_search();
+    }
+});
+
+
 // Initialize
 function initialize_variables() {
     // Is game running?
@@ -123,6 +140,9 @@ function bind_events() {
     // Detect Winner
     display_winner(GameConfig.winner);
 
+    // Drop handlers of the previous turn (the board is updated in place)
+    disable_user_interaction();
+
     // Event: Click Start Button
     $('#start-game-btn').off('click').on('click', function () {
       // 1. Start the timer
@@ -197,23 +217,10 @@ function bind_events() {
             $(this).addClass('board__square--selected'); // Add selection layout to the current square
             $('.board__square').removeClass('board__square--optionalmove'); // Remove all old optional move highlights
 
-            // Highlight possible moves
-            $.post('/possible_moves',
-              {
-                cur_x: current_position.x,
-                cur_y: current_position.y,
-                pieces: pieces_on_board(),
-                pieces_count: pieces_on_board().length,
-                board_size_x: $('tr').first().find('td').length,
-                board_size_y: $('tr').length,
-                current_turn: GameConfig.current_turn,
-              },
-              function (data, status) {
-                data.forEach(function (pos) {
-                  $(`.board__square[data-x="${pos[0]}"][data-y="${pos[1]}"]`).addClass('board__square--optionalmove');
-                });
-              }
-            );
+            // Highlight possible moves (legal moves of the turn are shipped with every board update)
+            (GameConfig.legal_moves[current_position.x + ',' + current_position.y] || []).forEach(function (pos) {
+              $(`.board__square[data-x="${pos[0]}"][data-y="${pos[1]}"]`).addClass('board__square--optionalmove');
+            });
 
           // Case 2: Piece not selected and and square does not have a piece
           } else if (current_position === undefined) {
@@ -243,32 +250,38 @@ function bind_events() {
               transition: 'transform .3s'
             });
 
-            var pieces = pieces_on_board();
-
-            // Send updated data to the backend [py fct. move()], update page and rerun bind_events
-            $.post('/move',
-              {
-                cur_x: current_position.x,
-                cur_y: current_position.y,
-                dst_x: destination.x,
-                dst_y: destination.y,
-                pieces: pieces,
-                pieces_count: pieces.length,
-                board_size_x: $('tr').first().find('td').length,
-                board_size_y: $('tr').length,
-                current_turn: GameConfig.current_turn,
-              },
-              function (data, status) {
-                setTimeout(function () {
-                  // $('body').html(data); // Update boddy (returned updated board html from flask)
-                  $('#board_with_figures_id').html(data);
-                  
-                  bind_events(); // Rerun bind_events
-                  update_turn_indicators();
-                  maybe_make_bot_move()
-                }, 300);
-              }
-            );
+            var move = {
+              from: [current_position.x, current_position.y],
+              to: [destination.x, destination.y],
+            };
+            var on_user_move = function (data) {
+              setTimeout(function () {
+                apply_move_changes(data); // Render the returned changes locally
+                
+                bind_events(); // Rerun bind_events
+                update_turn_indicators();
+              }, 300);
+            };
+            var on_move_rejected = function (error) {
+              $selected_piece.css({ transform: '', transition: '' });
+              if (error) alert(error);
+            };
+
+            if (playAgainstBot && window.fetch) {
+              // Send the move to the backend [py fct. api_move_and_reply()], the bot's reply follows in the same response
+              move_and_bot_reply(move, on_user_move, on_move_rejected);
+            } else {
+              // Send the move to the backend [py fct. api_move()], update board and rerun bind_events
+              post_json('/api/games/' + NewGameSettings.game_id + '/move', move,
+                function (data, status) {
+                  on_user_move(data);
+                  setTimeout(maybe_make_bot_move, 300);
+                },
+                function (xhr) {
+                  on_move_rejected(xhr.responseJSON && xhr.responseJSON.error);
+                }
+              );
+            }
           }
         });
       }
@@ -281,6 +294,9 @@ function bind_events() {
         if (!confirmRestart) return;
       }
 
+      // Drop the pending bot move of the old game (server cancels its search)
+      stop_following_bot_job();
+
       // let botLevel = window.botLevelInput.value; // Bot level setting disabled
       let gameTime = window.timeInput_sec.value;
       let boardSize = window.boardSizeInput.value;
@@ -293,7 +309,8 @@ function bind_events() {
           game_time_seconds: gameTime,
           board_size: boardSize,
           user_color: userColorInput,
-          play_against_bot: playAgainstBotInput
+          play_against_bot: playAgainstBotInput,
+          game_id: NewGameSettings.game_id
         },
         function (data, status) {
           $('body').html(data);
@@ -338,33 +355,40 @@ function display_winner(winner) {
 }
 
 
-function disable_user_interaction() {
-    $('.board__square').off('click');
-    $('.board__square').off('mouseenter mouseleave');
-}
+function apply_move_changes(changes) {
+    // Update the board in place from the changes of a move (moved piece, captures, winner, turn)
+    var $from = $(`.board__square[data-x="${changes.move.from[0]}"][data-y="${changes.move.from[1]}"]`);
+    var $to = $(`.board__square[data-x="${changes.move.to[0]}"][data-y="${changes.move.to[1]}"]`);
 
+    $from.find('.board__piece').first().css({ transform: '', transition: '' }).appendTo($to);
 
-function pieces_on_board() {
-    var board_state = [];
+    changes.captured.forEach(function (pos) {
+      $(`.board__square[data-x="${pos[0]}"][data-y="${pos[1]}"]`).find('.board__piece').remove();
+    });
 
-    $('.board__piece').each(function () {
-      var color;
-      if ($(this).hasClass('board__piece--dark')) {
-        color = 'DarkPiece';
-      }
-      if ($(this).hasClass('board__piece--light')) {
-        color = 'LightPiece';
-      }
+    $('.board__square').removeClass('board__square--selected board__square--optionalmove board__square--botcandidate');
 
-      board_state.push({
-        x: $(this).parent().data('x'),
-        y: $(this).parent().data('y'),
-        color: color,
-        king: $(this).hasClass('board__piece--king')
-      });
+    GameConfig.current_turn = changes.turn;
+    GameConfig.winner = changes.winner;
+    GameConfig.legal_moves = changes.legal_moves || {};
+}
+
+
+function post_json(url, data, success, error) {
+    return $.ajax({
+      url: url,
+      method: 'POST',
+      contentType: 'application/json',
+      data: JSON.stringify(data),
+      success: success,
+      error: error
     });
+}
 
-    return board_state;
+
+function disable_user_interaction() {
+    $('.board__square').off('click');
+    $('.board__square').off('mouseenter mouseleave');
 }
 
 
@@ -420,27 +444,147 @@ function maybe_make_bot_move() {
     const bot_color = (NewGameSettings.user_color === COLOR_LIGHT) ? COLOR_DARK : COLOR_LIGHT;
     const playAgainstBot = String(NewGameSettings.play_against_bot).toLowerCase() === 'true';
 
-    var pieces = pieces_on_board();
-
     if (GameConfig.winner !== 'light' && GameConfig.winner !== 'dark') {
       if (playAgainstBot && GameConfig.current_turn === bot_color) {
-        // Automatically call the Flask backend to make a bot move
+        // Automatically start a bot move search on the Flask backend
         $.post('/move_bot', {
-          pieces: pieces,
-          pieces_count: pieces.length,
-          board_size_x: $('tr').first().find('td').length,
-          board_size_y: $('tr').length,
-          current_turn: GameConfig.current_turn,
+          game_id: NewGameSettings.game_id,
         }, function (data, status) {
-          // Inject updated HTML and refresh events
-          setTimeout(function () {
-            $('#board_with_figures_id').html(data);
-            bind_events(); // Rebind to new DOM
-            update_turn_indicators();
-            maybe_make_bot_move()
-          }, 300);
+          follow_bot_job(data.job_id);
         });
       }
     }
 }
 
+
+function follow_bot_job(job_id) {
+    // Receive progress and result of a bot search (Server-Sent Events, polling as fallback)
+    window.botJob = { id: job_id };
+
+    window.botJob.timeout = setTimeout(function () {
+      stop_following_bot_job();
+      cancel_bot_search(); // Don't let the server search for nobody
+    }, BOT_REQUEST_TIMEOUT_MS);
+
+    if (window.EventSource) {
+      window.botJob.source = new EventSource('/move_bot/' + job_id + '/events');
+      window.botJob.source.onmessage = function (event) {
+        handle_bot_job_update(JSON.parse(event.data));
+      };
+    } else {
+      poll_bot_job(job_id);
+    }
+}
+
+
+function move_and_bot_reply(move, on_user_move, on_move_rejected) {
+    // Post the user move and read the streamed answer (NDJSON): user move first, then the bot job updates
+    var controller = new AbortController();
+    window.botJob = { id: null, controller: controller };
+
+    window.botJob.timeout = setTimeout(function () {
+      stop_following_bot_job(); // Closing the stream cancels the search on the server
+    }, BOT_REQUEST_TIMEOUT_MS);
+
+    fetch('/api/games/' + NewGameSettings.game_id + '/move_and_reply', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(move),
+      signal: controller.signal
+    }).then(function (response) {
+      if (!response.ok) {
+        stop_following_bot_job();
+        if (response.status === 404) window.location.href = '/play';
+        return response.json().then(function (data) { on_move_rejected(data.error); });
+      }
+
+      var reader = response.body.getReader();
+      var decoder = new TextDecoder();
+      var buffer = '';
+
+      function read() {
+        return reader.read().then(function (chunk) {
+          if (chunk.done) return;
+
+          buffer += decoder.decode(chunk.value, { stream: true });
+          var lines = buffer.split('\n');
+          buffer = lines.pop(); // Keep incomplete line
+
+          lines.forEach(function (line) {
+            if (!line.trim()) return; // Keepalive
+            var message = JSON.parse(line);
+
+            if (message.type === 'move') {
+              on_user_move(message);
+            } else if (message.type === 'bot') {
+              if (window.botJob) window.botJob.id = message.job.job_id;
+              handle_bot_job_update(message.job);
+            } else if (message.type === 'error') {
+              stop_following_bot_job();
+              alert(message.error);
+            }
+          });
+          return read();
+        });
+      }
+      return read();
+    }).catch(function () {
+      // Aborted (restart, timeout) or connection lost
+    });
+}
+
+
+function poll_bot_job(job_id) {
+    $.get('/move_bot/' + job_id, function (job, status) {
+      if (!window.botJob || window.botJob.id !== job_id) return; // Game was restarted
+
+      handle_bot_job_update(job);
+      if (window.botJob) {
+        window.botJob.pollTimer = setTimeout(function () { poll_bot_job(job_id); }, 250);
+      }
+    });
+}
+
+
+function handle_bot_job_update(job) {
+    // Show best move of the last completed search depth
+    $('.board__square').removeClass('board__square--botcandidate');
+    if (job.iterations.length) {
+      job.iterations[job.iterations.length - 1].move.forEach(function (pos) {
+        $(`.board__square[data-x="${pos[0]}"][data-y="${pos[1]}"]`).addClass('board__square--botcandidate');
+      });
+    }
+
+    if (job.status === 'done') {
+      stop_following_bot_job();
+
+      // Render the changes and refresh events
+      setTimeout(function () {
+        apply_move_changes(job);
+        bind_events(); // Rebind to new state
+        update_turn_indicators();
+        maybe_make_bot_move()
+      }, 300);
+    } else if (job.status === 'cancelled' || job.status === 'failed') {
+      stop_following_bot_job();
+    }
+}
+
+
+function stop_following_bot_job() {
+    if (!window.botJob) return;
+
+    if (window.botJob.source) window.botJob.source.close();
+    if (window.botJob.controller) window.botJob.controller.abort();
+    clearTimeout(window.botJob.pollTimer);
+    clearTimeout(window.botJob.timeout);
+    window.botJob = null;
+}
+
+
+function cancel_bot_search() {
+    // Tell the server to stop searching a bot move for this game
+    var data = new FormData();
+    data.append('game_id', NewGameSettings.game_id);
+    navigator.sendBeacon('/cancel_bot', data);
+}
@@ -0,0 +1,208 @@
+"""Tune the evaluation weights on positions of finished games (Texel method)
+
+    python tune.py games.log
+    python tune.py --simulate 2000 --board 8x8 --write
+
+Every position is labelled with the result of its game (white wins: 1, draw: 0.5, black wins: 0).
+The evaluation (from the view of white) is
+
+    points_per_piece_capture * (white pieces - black pieces) + points_per_move_option * (white mobility - black mobility)
+
+and sigmoid(K * evaluation) is fitted to the results by minimising the logistic loss:
+first K for the current weights, then the weights for this K. The king term is not tuned:
+losing the king loses the game, so its points only have to outweigh everything else.
+"""
+
+from python import global_variables as gl
+from python import gameboard
+from python import batch_eval
+from python import game_log
+from python import move_manager as move_mgr
+from python import rules
+from python import simulator
+
+import argparse, math, re, sys, time
+
+WEIGHT_KEYS = ('minimax_points_per_piece_capture', 'minimax_points_per_move_option')
+
+
+def main():
+    args = parse_args()
+    np = import_numpy()
+
+    start_time = time.time()
+    corpus = {} # (board_size_x, board_size_y) --> ([bitboard, ...], [result, ...])
+    if args.log:
+        load_game_log(corpus, args.log, args.skip_plies)
+    if args.simulate:
+        board_size_x, board_size_y = (int(value) for value in args.board.split('x'))
+        simulate_games(corpus, board_size_x, board_size_y, args.simulate, args.skip_plies)
+
+    features, results = compute_features(np, corpus)
+    print(f'{len(results)} positions of {sum(len(positions) > 0 for positions, _ in corpus.values())} board size(s) '
+          f'loaded in {time.time() - start_time:.1f} seconds', file=sys.stderr)
+    if len(results) == 0:
+        raise SystemExit('No positions to tune on')
+
+    weights = np.array([gl.CONFIG[key] for key in WEIGHT_KEYS], dtype=np.float64)
+    scale = fit_scale(np, features, results, weights)
+    print(f'K = {scale:.6g}, loss with current weights: {logistic_loss(np, features @ weights * scale, results):.6f}',
+          file=sys.stderr)
+
+    tuned = fit_weights(np, features, results, scale, weights)
+    tuned = np.maximum(np.round(tuned), 0).astype(np.int64)
+    print(f'Loss with tuned weights: {logistic_loss(np, features @ tuned * scale, results):.6f}', file=sys.stderr)
+
+    for key, old, new in zip(WEIGHT_KEYS, weights, tuned):
+        print(f'{key}: {old:g} -> {new}')
+
+    if args.write:
+        write_config(gl.config_path, dict(zip(WEIGHT_KEYS, tuned.tolist())))
+        print(f'Written to {gl.config_path}', file=sys.stderr)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Tune the evaluation weights on positions of finished games.')
+    parser.add_argument('log', nargs='?', help='Game log (see python/game_log.py)')
+    parser.add_argument('--simulate', type=int, default=0, metavar='GAMES',
+                        help='Add positions of self-played games (capture policy)')
+    parser.add_argument('--board', default=f'{gl.CONFIG["default_board_size_x"]}x{gl.CONFIG["default_board_size_y"]}',
+                        help='Board size XxY of the self-played games')
+    parser.add_argument('--skip-plies', type=int, default=4, help='Ignore the first plies of every game (opening)')
+    parser.add_argument('--write', action='store_true', help='Write the tuned weights to config.json')
+
+    args = parser.parse_args()
+    if not args.log and not args.simulate:
+        parser.error('Give a game log and/or --simulate')
+    return args
+
+
+def import_numpy():
+    if not batch_eval.is_numpy_available():
+        raise SystemExit('The tuner needs NumPy (pip install numpy)')
+    import numpy
+    return numpy
+
+
+# --------------------------------------------------------------------------
+# Corpus: positions with the result of their game
+# --------------------------------------------------------------------------
+
+def load_game_log(corpus: dict, path: str, skip_plies: int):
+    for record in game_log.read_games(path):
+        bitboards = [
+            bitboard for bitboard, _, move in game_log.replay_game(record)
+            if move is not None # Final position is decided
+        ]
+        add_game(corpus, record.board_size_x, record.board_size_y, bitboards[skip_plies:], record.winner)
+
+
+def simulate_games(corpus: dict, board_size_x: int, board_size_y: int, number_of_games: int, skip_plies: int):
+    sim = simulator.LockstepSimulator(
+        board_size_x, board_size_y,
+        number_of_games=min(number_of_games, 1000),
+        policy=simulator.capture_policy
+    )
+    for game in sim.run(number_of_games):
+        bitboards = []
+        bitboard = sim.initial_bitboard
+        with gameboard.board_geometry(board_size_x, board_size_y):
+            for cur_mask, dst_mask in game.history:
+                bitboards.append(bitboard)
+                bitboard = move_mgr.apply_move(*bitboard, cur_mask, dst_mask)[:4]
+        add_game(corpus, board_size_x, board_size_y, bitboards[skip_plies:], game.winner())
+
+
+def add_game(corpus: dict, board_size_x: int, board_size_y: int, bitboards: list, winner: int):
+    result = 1.0 if winner == game_log.WINNER_WHITE else 0.0 if winner == game_log.WINNER_BLACK else 0.5
+    positions, results = corpus.setdefault((board_size_x, board_size_y), ([], []))
+    for bitboard in bitboards:
+        if not any(rules.check_for_winner(*bitboard)):
+            positions.append(bitboard)
+            results.append(result)
+
+
+def compute_features(np, corpus: dict):
+    """Features of all positions, computed per board size with NumPy\n
+    Return: features (positions, weights), results (positions)"""
+
+    all_features = []
+    all_results = []
+    for (board_size_x, board_size_y), (positions, results) in corpus.items():
+        if not positions:
+            continue
+        with gameboard.board_geometry(board_size_x, board_size_y):
+            counts = batch_eval.piece_counts(positions)
+            mobility = batch_eval.mobility(positions)
+        all_features.append(np.stack([counts[:, 0] - counts[:, 2], mobility[:, 0] - mobility[:, 1]], axis=1))
+        all_results.append(np.array(results))
+
+    if not all_features:
+        return np.zeros((0, len(WEIGHT_KEYS))), np.zeros(0)
+    return np.concatenate(all_features).astype(np.float64), np.concatenate(all_results)
+
+
+# --------------------------------------------------------------------------
+# Fit (vectorised over all positions)
+# --------------------------------------------------------------------------
+
+def logistic_loss(np, scaled_scores, results) -> float:
+    """Mean cross entropy between the predicted (sigmoid of the scores) and the actual results"""
+    # log(1 + e^s) - r * s, written stable for large |s|
+    return float(np.mean(np.logaddexp(0.0, scaled_scores) - results * scaled_scores))
+
+
+def fit_scale(np, features, results, weights) -> float:
+    """Find K for the given weights (golden section search on log K)"""
+
+    scores = features @ weights
+    spread = float(np.std(scores)) or 1.0
+    low, high = math.log(1e-4 / spread), math.log(1e2 / spread)
+    ratio = (math.sqrt(5) - 1) / 2
+
+    def loss(log_scale):
+        return logistic_loss(np, scores * math.exp(log_scale), results)
+
+    for _ in range(80):
+        mid_low = high - ratio * (high - low)
+        mid_high = low + ratio * (high - low)
+        if loss(mid_low) < loss(mid_high):
+            high = mid_high
+        else:
+            low = mid_low
+    return math.exp((low + high) / 2)
+
+
+def fit_weights(np, features, results, scale: float, weights, iterations: int = 50):
+    """Minimise the logistic loss over the weights for a fixed K (Newton's method)\n
+    Return: tuned weights"""
+
+    scaled_features = features * scale
+    weights = weights.astype(np.float64)
+    for _ in range(iterations):
+        predicted = 1.0 / (1.0 + np.exp(-(scaled_features @ weights)))
+        gradient = scaled_features.T @ (predicted - results) / len(results)
+        hessian = (scaled_features.T * (predicted * (1.0 - predicted))) @ scaled_features / len(results)
+        hessian += np.eye(len(weights)) * 1e-9 # Features that never change
+        step = np.linalg.solve(hessian, gradient)
+        weights -= step
+        if np.max(np.abs(step)) < 1e-6:
+            break
+    return weights
+
+
+def write_config(path: str, values: dict):
+    """Replace values in the config file, keeping its layout"""
+
+    with open(path, newline='') as f:
+        text = f.read()
+    for key, value in values.items():
+        text, count = re.subn(rf'("{key}"\s*:\s*)[^,\r\n}}]+', rf'\g<1>{value}', text)
+        if count != 1:
+            raise ValueError(f'Key {key!r} not found in {path}')
+    with open(path, 'w', newline='') as f:
+        f.write(text)
+
+
+if __name__ == '__main__':
+    main()